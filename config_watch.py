@@ -0,0 +1,73 @@
+###########################################################################
+#
+# config_watch.py
+# Author:  agent
+# Date:    2026-10-19
+# Repository:
+# https://github.com/jglee72/encoder-dac.git
+# Description: Watch an encoder config file and report changes.
+#	The file is JSON using the long argument names of encoder.py, eg
+#		{"input": [5, 6, 23], "output": [17, 18], "resolution": 10,
+#		 "encoder": 30, "button": 300, "mech": false}
+#	Polls the file (mtime, size, inode) from a background thread so editors
+#	that replace the file are also picked up.  No extra packages needed.
+###########################################################################
+import json
+import os
+import threading
+
+class config_watch (object):
+	''' Call on_change(config) with the parsed file each time it changes
+	'''
+	def __init__(self, path, on_change, interval=0.5):
+		self.path = path
+		self.on_change = on_change
+		self.interval = interval
+		self.closing = threading.Event()
+		self.thread = None
+		self.stamp = self.file_stamp()
+
+	def file_stamp(self):
+		try:
+			st = os.stat(self.path)
+		except OSError:
+			return None
+		return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+	def read(self):
+		''' Parsed config dict, or None if missing or not valid JSON
+		'''
+		try:
+			with open(self.path) as f:
+				config = json.load(f)
+		except (IOError, OSError, ValueError) as e:
+			print("Config file not read:", self.path, e)
+			return None
+		if not isinstance(config, dict):
+			print("Config file not a JSON object:", self.path)
+			return None
+		return config
+
+	def start(self):
+		self.thread = threading.Thread(target=self.run, name="config_watch")
+		self.thread.daemon = True
+		self.thread.start()
+
+	def run(self):
+		while not self.closing.wait(self.interval):
+			stamp = self.file_stamp()
+			if stamp == None or stamp == self.stamp:
+				continue
+			self.stamp = stamp
+			config = self.read()
+			if config != None:
+				try:
+					self.on_change(config)
+				except Exception as e:
+					# Keep watching; a later edit may fix it
+					print("Config change not applied:", e)
+
+	def close(self):
+		self.closing.set()
+		if self.thread != None:
+			self.thread.join(1.0)
@@ -0,0 +1,245 @@
+###########################################################################
+#
+# dac_writer.py
+# Author:  agent
+# Date:    2026-10-19
+# Repository:
+# https://github.com/jglee72/encoder-dac.git
+# Description: DAC writer thread with I2C fault handling.
+#	write() only stores the latest code and wakes the writer thread, so
+#	GPIO callbacks and the main loop never wait on the I2C bus.  The thread
+#	sends the newest code; while the bus is failing it retries with
+#	exponential backoff, always with the newest code (values in between
+#	are dropped).  If a code has not gone through within retry_timeout the
+#	I2C device is closed and opened again (device reopen) and retries carry
+#	on; output never gives up.  After recover_after reopens in a row have
+#	not helped, the bus itself is recovered (bus_recover): a slave holding
+#	SDA low mid byte is clocked out on SCL and sent a STOP, by driving the
+#	I2C pins directly through /dev/gpiomem, then the pins go back to I2C.
+#	The device is first opened on the writer thread, so a bus that is down
+#	at startup takes the same retry path.  The same code is re-sent every
+#	refresh seconds in case the DAC was reset.
+#	Counters in metrics: i2c_failures, i2c_reopens, i2c_bus_recoveries,
+#	i2c_bus_stuck (SDA still low after recovery), dac_values_dropped,
+#	i2c_fault_ms (first failure -> next good write) and its max.
+###########################################################################
+import mmap
+import os
+import struct
+import threading
+import time
+import metrics
+
+# BCM283x/BCM2711 GPIO registers (Pi 1-4; the Pi 5 RP1 is laid out differently)
+GPFSEL0 = 0x00
+GPSET0 = 0x1C
+GPCLR0 = 0x28
+GPLEV0 = 0x34
+FSEL_INPUT = 0
+FSEL_OUTPUT = 1
+FSEL_ALT0 = 4
+# I2C bus 1 pins, BCM numbering
+SDA = 2
+SCL = 3
+
+class gpio_registers (object):
+	''' 32-bit GPIO registers from /dev/gpiomem; no root or RPi.GPIO needed
+	'''
+	def __init__(self, path="/dev/gpiomem"):
+		fd = os.open(path, os.O_RDWR | os.O_SYNC)
+		try:
+			self.map = mmap.mmap(fd, 4096)
+		finally:
+			os.close(fd)
+
+	def read(self, offset):
+		return struct.unpack_from('<I', self.map, offset)[0]
+
+	def write(self, offset, value):
+		struct.pack_into('<I', self.map, offset, value)
+
+	def close(self):
+		self.map.close()
+
+def set_function(regs, pin, function):
+	offset = GPFSEL0 + (pin // 10) * 4
+	shift = (pin % 10) * 3
+	regs.write(offset, (regs.read(offset) & ~(7 << shift)) | (function << shift))
+
+def bus_recover(regs=None, half_period=0.00005):
+	''' Free an I2C bus held low by a slave: up to 9 SCL clocks until SDA reads
+		high, then a STOP, then SDA and SCL back to ALT0 (I2C).  Lines are
+		driven open drain (output low, or input and the pull up).  Returns True
+		if SDA is high afterwards.
+	'''
+	opened = regs == None
+	if opened:
+		regs = gpio_registers()
+	def low(pin):
+		set_function(regs, pin, FSEL_OUTPUT)
+	def release(pin):
+		set_function(regs, pin, FSEL_INPUT)
+	def level(pin):
+		return (regs.read(GPLEV0) >> pin) & 1
+	try:
+		# Outputs drive low only; high comes from the pull ups
+		regs.write(GPCLR0, (1 << SDA) | (1 << SCL))
+		release(SDA)
+		release(SCL)
+		time.sleep(half_period)
+		for i in range(9):
+			if level(SDA):
+				break
+			low(SCL)
+			time.sleep(half_period)
+			release(SCL)
+			time.sleep(half_period)
+		# STOP: SDA goes low while SCL is low, then rises while SCL is high
+		low(SCL)
+		time.sleep(half_period)
+		low(SDA)
+		time.sleep(half_period)
+		release(SCL)
+		time.sleep(half_period)
+		release(SDA)
+		time.sleep(half_period)
+		freed = level(SDA) == 1
+	finally:
+		set_function(regs, SDA, FSEL_ALT0)
+		set_function(regs, SCL, FSEL_ALT0)
+		if opened:
+			regs.close()
+	return freed
+
+class dac_writer (object):
+	''' Latest value DAC writer.  open_dac() returns an MCP4725; it is called
+		from the writer thread, first use and after each device reopen.
+	'''
+	def __init__(self, open_dac, retry_timeout=0.5, backoff_min=0.001, backoff_max=0.05, refresh=0.5,
+			recover_after=2, recover_bus=bus_recover):
+		self.open_dac = open_dac
+		# Device reopens in a row before a bus recovery; recover_bus() frees SDA
+		self.recover_after = recover_after
+		self.recover_bus = recover_bus
+		self.reopens = 0
+		self.retry_timeout = retry_timeout
+		self.backoff_min = backoff_min
+		self.backoff_max = backoff_max
+		self.refresh = refresh
+		self.dac = None
+		self.latest = None
+		self.written = None
+		self.written_time = 0
+		# Last time the thread was seen working; used to gate the heartbeat
+		self.progress = time.time()
+		self.event = threading.Event()
+		self.closing = threading.Event()
+		self.thread = None
+
+	def write(self, value):
+		''' Queue a code for output; never blocks
+		'''
+		self.latest = min(max(value, 0), 4095)
+		self.event.set()
+
+	def encoder_changed(self, rotation, enabled):
+		''' Encoder listener; output follows the encoder without polling
+		'''
+		self.write(rotation)
+
+	def start(self):
+		self.thread = threading.Thread(target=self.run, name="dac_writer")
+		self.thread.daemon = True
+		self.thread.start()
+
+	def close(self):
+		self.closing.set()
+		self.event.set()
+		if self.thread != None:
+			self.thread.join(1.0)
+
+	def progress_age(self):
+		return time.time() - self.progress
+
+	def run(self):
+		while not self.closing.is_set():
+			self.event.wait(self.refresh)
+			self.event.clear()
+			self.progress = time.time()
+			if self.latest == None:
+				continue
+			if (self.latest != self.written or
+					self.progress - self.written_time >= self.refresh):
+				self.send()
+
+	def send(self):
+		''' Write the latest code, retrying until it goes through or closing
+		'''
+		backoff = self.backoff_min
+		first_failure = None
+		attempt_start = time.time()
+		value = self.latest
+		while not self.closing.is_set():
+			try:
+				if self.dac == None:
+					self.dac = self.open_dac()
+				self.dac.set_voltage(value)
+				self.reopens = 0
+			except (IOError, OSError) as e:
+				now = time.time()
+				self.progress = now
+				metrics.incr("i2c_failures")
+				if first_failure == None:
+					first_failure = now
+					print("DAC write failed, retrying:", e)
+				if now - attempt_start > self.retry_timeout:
+					self.reopen()
+					attempt_start = time.time()
+				self.closing.wait(backoff)
+				backoff = min(backoff * 2, self.backoff_max)
+				if self.latest != value:
+					metrics.incr("dac_values_dropped")
+					value = self.latest
+				continue
+			self.written = value
+			self.written_time = time.time()
+			self.progress = self.written_time
+			if first_failure != None:
+				fault = (self.written_time - first_failure) * 1000.0
+				print("DAC write recovered in %.1f ms" % fault)
+				metrics.record("i2c_fault_ms", fault)
+				metrics.record("i2c_fault_max_ms", max(fault,
+					metrics.snapshot().get("i2c_fault_max_ms", 0)))
+			return
+
+	def reopen(self):
+		''' Device reopen: drop the DAC handle; the next attempt opens it again.
+			Every recover_after reopens in a row the bus is recovered first.
+		'''
+		metrics.incr("i2c_reopens")
+		self.reopens += 1
+		# Adafruit_GPIO.I2C.Device has no close(); close its smbus file so
+		# repeated reopens do not leak descriptors
+		bus = getattr(getattr(self.dac, "_device", None), "_bus", None)
+		try:
+			if bus != None:
+				bus.close()
+		except (IOError, OSError):
+			pass
+		self.dac = None
+		if self.recover_bus != None and self.reopens % self.recover_after == 0:
+			self.bus_recovery()
+
+	def bus_recovery(self):
+		metrics.incr("i2c_bus_recoveries")
+		try:
+			freed = self.recover_bus()
+		except (IOError, OSError, ValueError) as e:
+			# No /dev/gpiomem (not a Pi 1-4, or no access); reopens carry on
+			print("I2C bus recovery not possible:", e)
+			return
+		if freed:
+			print("I2C bus recovery: SDA released")
+		else:
+			metrics.incr("i2c_bus_stuck")
+			print("I2C bus recovery: SDA still held low")
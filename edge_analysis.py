@@ -0,0 +1,274 @@
+###########################################################################
+#
+# edge_analysis.py
+# Author:  agent
+# Date:    2026-10-19
+# Repository:
+# https://github.com/jglee72/encoder-dac.git
+# Description: Encoder health from captured A/B edge streams.
+#	Works on whole NumPy arrays (no per edge python loops) so captures of
+#	tens of millions of edges take seconds.  Reports:
+#	- pulse widths per channel (time between changes on A, on B)
+#	- bounce bursts: back to back changes on one channel with no change on
+#		the other channel in between, closer than gap_ms
+#	- edge rate percentiles over window_ms windows
+#	- A/B phase error (ideal quadrature: B changes 90 deg into an A half
+#		cycle), at steady speed only: the A half cycles either side must be
+#		within 0.8-1.25 of the one measured, so speed changes are not
+#		read as phase error
+#	- illegal transitions: A and B both changed, or nothing changed
+#	and recommends the -e encoder bouncetime and -m (mechanical) setting
+#	for encoder.py.
+# Capture files: .npz with t (int64 ns, or float seconds) and either
+#	a, b  - A and B levels after each event (logic analyzer export), or
+#	pin, level - per pin edges, pin 0 = A, 1 = B (eg GPIO edge log)
+# Requires numpy; only this tool uses it.
+#	python edge_analysis.py capture.npz
+#	python edge_analysis.py --demo 20000000
+###########################################################################
+import argparse
+import time
+import numpy as np
+
+PERCENTILES = (1, 5, 50, 95, 99)
+
+def from_pin_edges(t, pin, level, a0=None, b0=None):
+	''' Per pin edge stream -> (t, a, b) with both levels at every edge.
+		Start levels default to the opposite of each channel's first edge.
+	'''
+	pin = np.asarray(pin)
+	level = np.asarray(level).astype(np.uint8)
+	index = np.arange(len(pin))
+	levels = []
+	for channel, start in ((0, a0), (1, b0)):
+		last = np.where(pin == channel, index, -1)
+		np.maximum.accumulate(last, out=last)
+		if start == None:
+			first = np.flatnonzero(pin == channel)
+			start = 1 - level[first[0]] if len(first) else 0
+		levels.append(np.where(last >= 0, level[last], start).astype(np.uint8))
+	return np.asarray(t), levels[0], levels[1]
+
+def to_ns(t):
+	''' Timestamps as int64 ns; float input is taken as seconds
+	'''
+	t = np.asarray(t)
+	if np.issubdtype(t.dtype, np.floating):
+		return np.round(t * 1e9).astype(np.int64)
+	return t.astype(np.int64)
+
+def distribution(values_ns):
+	''' Summary in ms: count, min, percentiles
+	'''
+	if len(values_ns) == 0:
+		return {"count": 0}
+	values = np.asarray(values_ns, dtype=np.float64) / 1e6
+	result = {"count": int(len(values)), "min": float(values.min())}
+	for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+		result["p%d" % p] = float(v)
+	return result
+
+def analyse(t, a, b, gap_ms=1.0, window_ms=10.0):
+	''' Encoder health of one capture.  t in ns (sorted), a and b levels.
+	'''
+	t = to_ns(t)
+	if not (len(t) == len(a) == len(b)):
+		raise ValueError("t, a and b lengths differ: %d %d %d" % (len(t), len(a), len(b)))
+	order = None
+	if len(t) > 1 and np.any(t[1:] < t[:-1]):
+		order = np.argsort(t, kind="stable")
+		t = t[order]
+	a = np.asarray(a, dtype=np.uint8)
+	b = np.asarray(b, dtype=np.uint8)
+	if order is not None:
+		a = a[order]
+		b = b[order]
+	gap_ns = int(gap_ms * 1e6)
+	report = {"events": int(len(t))}
+	if len(t) < 3:
+		return report
+	report["duration_s"] = float(t[-1] - t[0]) / 1e9
+
+	state = (a << 1) | b
+	change = state[1:] ^ state[:-1]
+	t1 = t[1:]
+	transitions = len(change)
+	# 1 = only B changed, 2 = only A changed, 0 or 3 = illegal
+	illegal = (change == 0) | (change == 3)
+	report["illegal"] = int(np.count_nonzero(illegal))
+	report["illegal_rate"] = report["illegal"] / float(transitions)
+	report["both_changed"] = int(np.count_nonzero(change == 3))
+	report["no_change"] = int(np.count_nonzero(change == 0))
+
+	# Time weighted fraction of A high; mechanical detents rest LO
+	dt_all = np.diff(t)
+	total = float(dt_all.sum())
+	report["a_high_fraction"] = float(dt_all[a[:-1] == 1].sum()) / total if total else 0.0
+	report["b_high_fraction"] = float(dt_all[b[:-1] == 1].sum()) / total if total else 0.0
+
+	# Pulse widths per channel; widths under gap are bounce, not motion
+	channel = np.where(change == 2, 0, np.where(change == 1, 1, -1)).astype(np.int8)
+	ta = t1[channel == 0]
+	tb = t1[channel == 1]
+	for name, times, levels in (("a", ta, a[1:][channel == 0]), ("b", tb, b[1:][channel == 1])):
+		widths = np.diff(times)
+		report["pulse_" + name] = distribution(widths)
+		report["pulse_" + name + "_high"] = distribution(widths[levels[:-1] == 1])
+		report["pulse_" + name + "_low"] = distribution(widths[levels[:-1] == 0])
+		report["pulse_" + name + "_clean"] = distribution(widths[widths >= gap_ns])
+
+	# Bounce bursts: runs of same channel changes closer than gap
+	step = np.diff(t1)
+	same = (channel[1:] == channel[:-1]) & (channel[:-1] >= 0) & (step < gap_ns)
+	edges = np.diff(np.concatenate(([0], same.astype(np.int8), [0])))
+	starts = np.flatnonzero(edges == 1)
+	ends = np.flatnonzero(edges == -1)
+	burst_edges = ends - starts + 1
+	report["bounce"] = distribution(t1[ends] - t1[starts])
+	report["bounce_bursts"] = int(len(starts))
+	report["bounce_edges"] = int(burst_edges.sum() - len(starts))
+	report["bounce_fraction"] = report["bounce_edges"] / float(transitions)
+	report["bounce_edges_max"] = int(burst_edges.max()) if len(starts) else 0
+
+	# Edge rate over fixed windows; only windows with activity
+	window_ns = int(window_ms * 1e6)
+	counts = np.bincount((t - t[0]) // window_ns)
+	rates = counts[counts > 0] / (window_ms / 1000.0)
+	report["edge_rate"] = dict(("p%d" % p, float(v)) for p, v in
+		zip((50, 90, 99), np.percentile(rates, (50, 90, 99))))
+	report["edge_rate"]["max"] = float(rates.max())
+
+	# Phase: each B change inside an A half cycle holding exactly one B change,
+	# with a steady speed half cycle either side
+	phase = np.empty(0)
+	report["phase_unsteady"] = 0
+	if len(ta) > 3 and len(tb):
+		half = np.diff(ta).astype(np.float64)
+		k = np.searchsorted(ta, tb, side="right")
+		# B change in half cycle k - 1; half cycles k - 2 and k must exist
+		inside = (k > 1) & (k < len(ta) - 1)
+		k = k[inside]
+		tb_in = tb[inside]
+		per_interval = np.bincount(k, minlength=len(ta) + 1)
+		single = per_interval[k] == 1
+		k = k[single]
+		tb_in = tb_in[single]
+		half_cycle = half[k - 1]
+		ratio_before = half[k - 2] / half_cycle
+		ratio_after = half[k] / half_cycle
+		steady = ((ratio_before >= 0.8) & (ratio_before <= 1.25) &
+			(ratio_after >= 0.8) & (ratio_after <= 1.25))
+		report["phase_unsteady"] = int(np.count_nonzero(~steady))
+		phase = 180.0 * (tb_in[steady] - ta[k - 1][steady]) / half_cycle[steady] - 90.0
+	if len(phase):
+		error = np.abs(phase)
+		report["phase_error_deg"] = dict(("p%d" % p, float(v)) for p, v in
+			zip((50, 95, 99), np.percentile(error, (50, 95, 99))))
+		report["phase_error_deg"]["mean_signed"] = float(phase.mean())
+		report["phase_error_deg"]["count"] = int(len(phase))
+	return report
+
+def recommend(report):
+	''' encoder.py settings from an analyse() report:
+		{"encoder": -e bouncetime ms, "mech": use -m, "notes": [..]}
+	'''
+	notes = []
+	bounce = report.get("bounce", {"count": 0})
+	if bounce["count"]:
+		needed = int(np.ceil(bounce["p99"] * 1.5))
+	else:
+		needed = 1
+		notes.append("no bounce seen; smallest bouncetime is enough")
+	needed = max(needed, 1)
+	# RPi.GPIO drops edges on a pin within bouncetime of the last one, so stay
+	# under half the shortest real pulse on either channel
+	clean = [report[key]["p1"] for key in ("pulse_a_clean", "pulse_b_clean")
+		if report.get(key, {"count": 0})["count"]]
+	encoder_bounce = needed
+	if clean:
+		limit = int(np.floor(min(clean) * 0.5))
+		if needed > limit:
+			notes.append("bounce (%.2f ms p99) too close to shortest pulse (%.2f ms p1); "
+				"debounce will drop real edges, consider an RC filter" % (bounce.get("p99", 0), min(clean)))
+			encoder_bounce = limit
+	# RPi.GPIO add_event_detect rejects a bouncetime under 1 ms
+	encoder_bounce = int(min(max(encoder_bounce, 1), 100))
+
+	# -m is a waveform choice (A falling edge + B level, a quarter of the
+	# resolution), not noise handling: only for outputs that rest LO
+	mech = False
+	if report.get("a_high_fraction", 0.5) < 0.3:
+		mech = True
+		notes.append("A rests LO between detents (%.0f%% high): mechanical style output"
+			% (report["a_high_fraction"] * 100))
+	if report.get("illegal_rate", 0) > 0.01 or report.get("bounce_fraction", 0) > 0.05:
+		notes.append("noisy signal (%.1f%% illegal, %.1f%% bounce): check wiring, pull ups or an RC filter"
+			% (report.get("illegal_rate", 0) * 100, report.get("bounce_fraction", 0) * 100))
+	phase = report.get("phase_error_deg")
+	if phase != None and phase["p95"] > 45:
+		notes.append("A/B phase error p95 %.0f deg; check encoder alignment or wiring" % phase["p95"])
+	return {"encoder": encoder_bounce, "mech": mech, "notes": notes}
+
+def synthetic_capture(edges, mean_gap_ms=2.0, bounce_prob=0.05, bounce_ms=0.3, seed=0):
+	''' Quadrature capture (t ns, a, b) with contact bounce, for testing.
+		Ideal 90 deg phase; speed drifts smoothly (about 0.5x to 2x, like a
+		hand turned knob) with 3% edge to edge jitter.
+	'''
+	rng = np.random.default_rng(seed)
+	direction = np.where(rng.random(edges) < 0.98, 1, -1)
+	position = np.cumsum(direction)
+	gray = np.array([0, 1, 3, 2], dtype=np.uint8)
+	state = gray[position % 4]
+	i = np.arange(edges)
+	drift = (0.5 * np.sin(2 * np.pi * i / 500.0 + rng.random() * 6.3) +
+		0.2 * np.sin(2 * np.pi * i / 137.0 + rng.random() * 6.3))
+	jitter = 1.0 + 0.03 * rng.standard_normal(edges)
+	gaps = mean_gap_ms * 1e6 * np.exp(drift) * jitter + 3 * bounce_ms * 1e6
+	t = np.cumsum(gaps).astype(np.int64)
+	bounced = np.flatnonzero(rng.random(edges) < bounce_prob)[1:]
+	previous = state[bounced - 1]
+	jitter = (rng.random(len(bounced)) * bounce_ms * 1e6).astype(np.int64)
+	t = np.concatenate((t, t[bounced] + jitter + 1, t[bounced] + 2 * jitter + 2))
+	state = np.concatenate((state, previous, state[bounced]))
+	order = np.argsort(t, kind="stable")
+	state = state[order]
+	return t[order], (state >> 1) & 1, state & 1
+
+def load(path):
+	capture = np.load(path)
+	if "a" in capture:
+		return to_ns(capture["t"]), capture["a"], capture["b"]
+	return from_pin_edges(to_ns(capture["t"]), capture["pin"], capture["level"])
+
+def print_report(report, settings):
+	for key in sorted(report):
+		print(key, ":", report[key])
+	print("Recommended: -e", settings["encoder"], "-m" if settings["mech"] else "(optical, no -m)")
+	for note in settings["notes"]:
+		print("  -", note)
+
+def main():
+	ap = argparse.ArgumentParser(description='Encoder health and setting advice from captured A/B edges')
+	ap.add_argument("capture", nargs='?',
+		help=".npz with t and a, b (levels) or pin, level (per pin edges)")
+	ap.add_argument("-g", "--gap", type=float, default=1.0,
+		help="Bounce gap in mS; same channel changes closer than this are bounce (default: 1)")
+	ap.add_argument("-w", "--window", type=float, default=10.0,
+		help="Edge rate window in mS (default: 10)")
+	ap.add_argument("--demo", type=int, required=False,
+		help="Analyse a synthetic capture with this many edges instead of a file")
+	args = vars(ap.parse_args())
+	if args["demo"] != None:
+		t, a, b = synthetic_capture(args["demo"])
+	elif args["capture"] != None:
+		t, a, b = load(args["capture"])
+	else:
+		ap.error("capture file or --demo needed")
+	start = time.time()
+	report = analyse(t, a, b, gap_ms=args["gap"], window_ms=args["window"])
+	settings = recommend(report)
+	print_report(report, settings)
+	print("analysed %d events in %.2f s" % (len(t), time.time() - start))
+
+if __name__=='__main__':
+	main()
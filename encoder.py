@@ -43,16 +43,48 @@
 # 2019-10-17 -JGL
 # - Changes made without hardware present:
 #	- Encoder Enable output requires posotive going pulse to GSS HW
+#
+# 2026-10-19 - agent
+#	- Resolve merge conflict in enable_encoder; keep pulse_trim_enable
+#	- All rotation/enable changes go through one locked accumulator
+#		(step, set_rotation, set_enabled) with change listeners
+#	- Add GSS server (gss_server.py): unix/tcp socket streaming position,
+#		enable and DAC code; accepts set point and enable commands
+#	- Add new argument categories: {unix socket, tcp port, tcp bind}
+#	- Add position journal (journal.py); restore rotation and enable state
+#		before the first DAC write. New arguments {journal, no journal}
+#	- Add config file mode (-c) with hot reload (config_watch.py); only
+#		changed event detects are re-registered, decoder table swapped whole
+#	- encoder_interrupt decodes by pin role instead of fixed pins 5 and 6
+#	- Fast startup: write the restored (or 2048) code straight to the DAC
+#		over /dev/i2c before importing RPi.GPIO/Adafruit drivers and before
+#		argument checks; report time to first output (metrics.py)
+#	- Add new argument categories: {metrics file}
+#	- Add supervisor mode (--supervise, supervisor.py): heartbeat from the
+#		DAC loop, restart on crash/stall via a hot standby child that
+#		resumes at the last heartbeat position; restart latency in metrics
+#	- DAC output through dac_writer.py: writer thread follows the encoder,
+#		retries I2C errors with backoff, reopens the device, recovers a stuck
+#		bus (SCL clocking and STOP), resends only the latest code; I2C
+#		faults no longer end the main loop
 ###########################################################################
-import RPi.GPIO as GPIO
 import time
-import Adafruit_MCP4725
+# Startup reference for the time-to-first-output metric
+START_TIME = time.time()
+import threading
+import os
+import journal
+import metrics
 # for command line arguments
 import sys
 import argparse
+# RPi.GPIO, Adafruit_MCP4725 (Adafruit_GPIO), gss_server and config_watch are
+# imported after the first DAC output; see import_gpio() and main()
+GPIO = None
 # Globals
 DEBUG = False
 MECH_ENC = False
+JOURNAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "encoder.journal")
 RPI_INPUT = set([0,1,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,
 	22,23,24,25,26,27])
 
@@ -60,17 +92,26 @@ class encoder (object):
 	''' Class for encdoder functions.  Expansion for multiple rotary encoders
 		Addressed by i/o pin definition.
 	'''
-	def __init__(self, ip_a=5, ip_b=6, ip_pb=23, op_led=17, op_en=18 ,enc_bounce=30,btn_bounce=300,enc_resolution=10):
+	def __init__(self, ip_a=5, ip_b=6, ip_pb=23, op_led=17, op_en=18 ,enc_bounce=30,btn_bounce=300,enc_resolution=10,rotation=2048,enabled=False):
 		self.input_a = ip_a
 		self.input_b = ip_b
 		self.input_pb = ip_pb
 		self.enc_bouncetime = enc_bounce
 		self.btn_bouncetime = btn_bounce
-		self.rotation = 2048
-		self.encoder_enabled = False
+		# Start state; restored from the position journal after a restart
+		self.rotation = rotation
+		self.encoder_enabled = enabled
 		self.enc_res = enc_resolution
 		self.output_led = op_led
 		self.output_en = op_en
+		self.mech_enc = MECH_ENC
+		if GPIO == None:
+			import_gpio()
+		# GPIO callbacks and the GSS server both change rotation/enable
+		self.lock = threading.Lock()
+		self.listeners = []
+		# Held for a whole toggle and its GSS pulse; pulses never overlap
+		self.pulse_lock = threading.RLock()
 		#Setup the IO
 		self.setup_io()
 
@@ -81,13 +122,128 @@ class encoder (object):
 		#	- Optical outputs are steady state - i.e. stay HI or LO until next indent
 		#		It takes 4 indent clicks to go through cycle as stated in datasheet
 		#	- Mechanical outputs momentary waveforms - i.e. always returns to LO
-		if MECH_ENC:
-			GPIO.add_event_detect(self.input_a,GPIO.FALLING, self.encoder_interrupt, self.enc_bouncetime)
-			GPIO.add_event_detect(self.input_pb,GPIO.FALLING, self.enable_encoder, self.btn_bouncetime)
+		self.decoder = self.decoder_setup()
+		self.events = self.event_setup()
+		for pin in self.events:
+			GPIO.add_event_detect(pin, *self.events[pin])
+
+	def event_setup(self):
+		''' Edge detection for the current settings: {pin: (edge, callback, bouncetime)}
+		'''
+		events = {}
+		if self.mech_enc:
+			events[self.input_a] = (GPIO.FALLING, self.encoder_interrupt, self.enc_bouncetime)
 		else:
-			GPIO.add_event_detect(self.input_a,GPIO.BOTH, self.encoder_interrupt, self.enc_bouncetime)
-			GPIO.add_event_detect(self.input_b,GPIO.BOTH, self.encoder_interrupt, self.enc_bouncetime)
-			GPIO.add_event_detect(self.input_pb,GPIO.FALLING, self.enable_encoder, self.btn_bouncetime)
+			events[self.input_a] = (GPIO.BOTH, self.encoder_interrupt, self.enc_bouncetime)
+			events[self.input_b] = (GPIO.BOTH, self.encoder_interrupt, self.enc_bouncetime)
+		events[self.input_pb] = (GPIO.FALLING, self.enable_encoder, self.btn_bouncetime)
+		return events
+
+	def decoder_setup(self):
+		''' Snapshot used by encoder_interrupt; replaced as a whole on reconfigure
+			(pin roles, decoder table, input A, input B, resolution)
+		'''
+		roles = {self.input_a: 0}
+		if not self.mech_enc:
+			roles[self.input_b] = 1
+		return (roles, decoder_table(self.mech_enc), self.input_a, self.input_b, self.enc_res)
+
+	def settings(self):
+		''' Current settings as reconfigure() keyword arguments
+		'''
+		return {"ip_a": self.input_a, "ip_b": self.input_b, "ip_pb": self.input_pb,
+			"op_led": self.output_led, "op_en": self.output_en,
+			"enc_bounce": self.enc_bouncetime, "btn_bounce": self.btn_bouncetime,
+			"enc_resolution": self.enc_res, "mech": self.mech_enc}
+
+	def reconfigure(self, ip_a, ip_b, ip_pb, op_led, op_en, enc_bounce, btn_bounce, enc_resolution, mech):
+		''' Apply new settings while running.  Only pins whose edge detection
+			changed are re-registered; rotation and enable state are kept.
+			If RPi.GPIO refuses a change (pin in use, edge detection failed) the
+			old settings and edge detection are put back and the error raised.
+		'''
+		old_settings = self.settings()
+		old_events = dict(self.events)
+		try:
+			self.apply_settings(ip_a, ip_b, ip_pb, op_led, op_en, enc_bounce, btn_bounce, enc_resolution, mech)
+		except (RuntimeError, ValueError):
+			self.restore_settings(old_settings, old_events)
+			raise
+
+	def set_settings(self, ip_a, ip_b, ip_pb, op_led, op_en, enc_bounce, btn_bounce, enc_resolution, mech):
+		self.input_a = ip_a
+		self.input_b = ip_b
+		self.input_pb = ip_pb
+		self.output_led = op_led
+		self.output_en = op_en
+		self.enc_bouncetime = enc_bounce
+		self.btn_bouncetime = btn_bounce
+		self.enc_res = enc_resolution
+		self.mech_enc = mech
+
+	def apply_settings(self, ip_a, ip_b, ip_pb, op_led, op_en, enc_bounce, btn_bounce, enc_resolution, mech):
+		''' reconfigure() work; self.events follows each GPIO call so a failure
+			part way through can be undone
+		'''
+		old_events = dict(self.events)
+		old_inputs = set([self.input_a, self.input_b, self.input_pb])
+		old_led = self.output_led
+		old_en = self.output_en
+		self.set_settings(ip_a, ip_b, ip_pb, old_led, old_en, enc_bounce, btn_bounce, enc_resolution, mech)
+		new_events = self.event_setup()
+		new_inputs = set([ip_a, ip_b, ip_pb])
+		if DEBUG:
+			print("reconfigure events:", old_events, "->", new_events)
+		for pin in old_events:
+			if new_events.get(pin) != old_events[pin]:
+				GPIO.remove_event_detect(pin)
+				del self.events[pin]
+		for pin in new_inputs - old_inputs:
+			GPIO.setup(pin, GPIO.IN)
+		# Single assignment; callbacks see either the old or the new decoder
+		self.decoder = self.decoder_setup()
+		for pin in new_events:
+			if old_events.get(pin) != new_events[pin]:
+				GPIO.add_event_detect(pin, *new_events[pin])
+				self.events[pin] = new_events[pin]
+		# Release pins no longer used; a pin may move between input and output
+		new_outputs = set([op_led, op_en])
+		for pin in old_inputs - new_inputs - new_outputs:
+			GPIO.cleanup(pin)
+		for pin in set([old_led, old_en]) - new_outputs - new_inputs:
+			GPIO.output(pin, False)
+			GPIO.cleanup(pin)
+		if op_led != old_led:
+			GPIO.setup(op_led, GPIO.OUT)
+			GPIO.output(op_led, self.encoder_enabled)
+		if op_en != old_en:
+			GPIO.setup(op_en, GPIO.OUT)
+			GPIO.output(op_en, False)
+		self.output_led = op_led
+		self.output_en = op_en
+
+	def restore_settings(self, settings, events):
+		''' Undo a failed apply_settings(): old settings, pin directions and
+			edge detection
+		'''
+		print("Reconfigure failed...restoring previous settings")
+		for pin in list(self.events):
+			if events.get(pin) != self.events[pin]:
+				GPIO.remove_event_detect(pin)
+				del self.events[pin]
+		self.set_settings(**settings)
+		for pin in set([self.input_a, self.input_b, self.input_pb]):
+			GPIO.setup(pin, GPIO.IN)
+		GPIO.setup(self.output_led, GPIO.OUT)
+		GPIO.output(self.output_led, self.encoder_enabled)
+		GPIO.setup(self.output_en, GPIO.OUT)
+		GPIO.output(self.output_en, False)
+		self.decoder = self.decoder_setup()
+		for pin in events:
+			if self.events.get(pin) != events[pin]:
+				GPIO.add_event_detect(pin, *events[pin])
+				self.events[pin] = events[pin]
+
 	def read_encoder(self,pin):
 		''' Simple function to return rpi gpio pin
 		'''
@@ -106,7 +262,7 @@ class encoder (object):
 		GPIO.setup(self.input_b, GPIO.IN)
 		GPIO.setup(self.input_pb, GPIO.IN)
 		GPIO.setup(self.output_led, GPIO.OUT)
-		GPIO.output(self.output_led, False)
+		GPIO.output(self.output_led, self.encoder_enabled)
 		GPIO.setup(self.output_en, GPIO.OUT)
 		GPIO.output(self.output_en, False)
 
@@ -122,36 +278,76 @@ class encoder (object):
 		if DEBUG:
 			print("toggled pin",pin)
 			print("en1",self.encoder_enabled)
-		self.rotation = 2048
-		print ("rotation = ",self.rotation)
-		self.encoder_enabled = not(self.encoder_enabled)
+		# Read and toggle under the pulse lock; a GSS command may be mid pulse
+		with self.pulse_lock:
+			self.set_enabled(not(self.encoder_enabled))
 		if DEBUG:
 			print("en2",self.encoder_enabled)
-		if self.encoder_enabled == True:
-			GPIO.output(self.output_led, True)
-<<<<<<< HEAD
-#			GPIO.output(self.output_en, True)
-			self.pulse_trim_enable()
-		else:
-			GPIO.output(self.output_led, False)
-#			GPIO.output(self.output_en, False)
+
+	def set_enabled(self, enabled):
+		''' Set the encoder enable status; shared by the push button and the
+			GSS server.  Resets rotation and pulses GSS HW on every change.
+			Returns False when already in the requested state.
+		'''
+		with self.pulse_lock:
+			with self.lock:
+				if self.encoder_enabled == enabled:
+					return False
+				self.rotation = 2048
+				self.encoder_enabled = enabled
+			print ("rotation = ",2048)
+			GPIO.output(self.output_led, enabled)
+			self.notify()
+#			GPIO.output(self.output_en, enabled)
 			self.pulse_trim_enable()
-=======
-			self.pulse_enable()
-#			GPIO.output(self.output_en, True)
-		else:
-			GPIO.output(self.output_led, False)
-#			GPIO.output(self.output_en, False)
-			self.pulse_enable()
->>>>>>> 0a537d2b46d8dd153d03ae2e50a0ed32dde0a665
+		return True
 
 	def pulse_enable(self):
 		''' Project specific. Change here for different application requirements - i.e. toggle instead
 		'''
-			GPIO.output(self.output_en, True)
-			time.sleep(0.1)
-			GPIO.output(self.output_en, False)
-			
+		GPIO.output(self.output_en, True)
+		time.sleep(0.1)
+		GPIO.output(self.output_en, False)
+
+	def add_listener(self, listener):
+		''' Register listener(rotation, enabled), called after every change.
+			Listeners run on the GPIO callback thread; keep them short.
+		'''
+		self.listeners.append(listener)
+
+	def notify(self):
+		rotation, enabled = self.get_state()
+		for listener in self.listeners:
+			listener(rotation, enabled)
+
+	def get_state(self):
+		''' Consistent (rotation, enabled) snapshot
+		'''
+		with self.lock:
+			return self.rotation, self.encoder_enabled
+
+	def step(self, delta):
+		''' Accumulator for encoder movement; ignored while disabled
+		'''
+		with self.lock:
+			if self.encoder_enabled == False:
+				return False
+			self.rotation += delta
+		self.notify()
+		return True
+
+	def set_rotation(self, value):
+		''' Set point from GSS host; clamped to the DAC 12-bit range and
+			ignored while disabled, same as encoder movement.
+		'''
+		value = min(max(int(value), 0), 4095)
+		with self.lock:
+			if self.encoder_enabled == False:
+				return False
+			self.rotation = value
+		self.notify()
+		return True
+
 	def encoder_interrupt(self,pin):
 		''' Interrupt function called on 'pin' changes; see above for criteria
 		'''
@@ -161,28 +357,104 @@ class encoder (object):
 			if DEBUG:
 				print("encoder disabled...push button to enable")
 			return
-		if MECH_ENC:
-			# Limit detection taken care of in ADC class (0-4095 count)
-			if (self.read_encoder(self.input_b) == 1):
-				self.rotation += self.enc_res
-			else:
-				self.rotation -= self.enc_res
-		else:
-			# A has triggered interrupt
-			if pin==5:
-				if (self.read_encoder(self.input_a) == self.read_encoder(self.input_b)):
-					self.rotation -= self.enc_res
-				else:
-					self.rotation += self.enc_res
-			# B has triggered interrupt
-			if pin==6:
-				if (self.read_encoder(self.input_a) == self.read_encoder(self.input_b)):
-					self.rotation += self.enc_res
-				else:
-					self.rotation -= self.enc_res
+		# Optical: A and B interrupt on both edges; Mechanical: A falling only
+		# Limit detection taken care of in ADC class (0-4095 count)
+		roles, table, input_a, input_b, resolution = self.decoder
+		role = roles.get(pin)
+		if role == None:
+			return
+		level_a = self.read_encoder(input_a)
+		level_b = self.read_encoder(input_b)
+		self.step(table[(role, level_a, level_b)] * resolution)
 		if DEBUG:
 			print ("rotation = ", self.rotation)
 
+def import_gpio():
+	''' RPi.GPIO import deferred until after the first DAC output
+	'''
+	global GPIO
+	import RPi.GPIO as GPIO
+
+def process_age():
+	''' Seconds since this process started (from /proc), None if unknown
+	'''
+	try:
+		with open("/proc/self/stat") as f:
+			# Field 22 is start time in clock ticks since boot; skip past (comm)
+			start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+		with open("/proc/uptime") as f:
+			uptime = float(f.read().split()[0])
+	except (IOError, OSError, ValueError, IndexError):
+		return None
+	return uptime - start_ticks / float(os.sysconf("SC_CLK_TCK"))
+
+def early_dac_write(value, address=0x62, busnum=1):
+	''' Write a DAC code with a bare /dev/i2c write; no driver imports.
+		Same bytes as MCP4725.set_voltage (WRITEDAC 0x40, 12-bit value).
+	'''
+	import fcntl
+	I2C_SLAVE = 0x0703
+	value = min(max(value, 0), 4095)
+	fd = os.open("/dev/i2c-%d" % busnum, os.O_RDWR)
+	try:
+		fcntl.ioctl(fd, I2C_SLAVE, address)
+		os.write(fd, bytearray([0x40, (value >> 4) & 0xFF, (value << 4) & 0xFF]))
+	finally:
+		os.close(fd)
+
+def restore_output(args, resume, address, busnum):
+	''' Restore the last position (journal, or resume from the supervisor)
+		and write it straight to the DAC.  Returns (journal, rotation, enabled);
+		journal is None if turned off or not available.
+	'''
+	position_journal = None
+	start_rotation = 2048
+	start_enabled = False
+	if (args["no_journal"] == False):
+		restore_start = time.time()
+		try:
+			position_journal = journal.journal(args["journal"])
+			restored = position_journal.load()
+		except (IOError, OSError, ValueError) as e:
+			# No journal is no reason to hold back the output
+			print("Position journal not available, starting at 2048 disabled:", e)
+			position_journal = None
+			restored = None
+		if (restored != None and resume == None):
+			start_rotation, start_enabled = restored
+			metrics.record("journal_restore_ms", (time.time() - restore_start) * 1000.0)
+	if resume != None:
+		# Position handed over by the supervisor is newer than the journal
+		start_rotation, start_enabled = resume
+		print("resumed rotation, enabled:", start_rotation, start_enabled)
+	try:
+		early_dac_write(start_rotation, address, busnum)
+		first_output = time.time()
+		age = None
+		# Process age only means launch time for the first process started
+		if (args["standby_fd"] == None and args["start_time"] == None):
+			age = process_age()
+		metrics.record("first_output_ms", (first_output - START_TIME) * 1000.0)
+		if age != None:
+			metrics.record("first_output_process_ms", age * 1000.0)
+	except (IOError, OSError) as e:
+		print("Early DAC write failed, output set by driver:", e)
+	return (position_journal, start_rotation, start_enabled)
+
+def decoder_table(mech):
+	''' Direction lookup {(pin role, level A, level B): +1/-1}; role 0 = A, 1 = B
+	'''
+	table = {}
+	for level_a in (0, 1):
+		for level_b in (0, 1):
+			if mech:
+				# A falling edge; B HI counts up
+				table[(0, level_a, level_b)] = 1 if level_b == 1 else -1
+			else:
+				table[(0, level_a, level_b)] = -1 if level_a == level_b else 1
+				table[(1, level_a, level_b)] = 1 if level_a == level_b else -1
+	return table
+
 def check_input(args):
 	''' Check for valid input numbers for RPI.
 	'''
@@ -245,10 +517,82 @@ def check_encoder_bounce(args):
 	else:
 		return True
 
+def check_port(args):
+	''' GSS server tcp port arguments check
+	'''
+	# Check for no arguments
+	if DEBUG:
+		print("Checking tcp port inline argumnets: ", args)
+	if (args == None or int(args) < 1 or int(args) >65535):
+		if DEBUG:
+			print ("TCP port out of range (1-65535), or None")
+		return False
+	else:
+		return True
+
+def check_pins(inputs, outputs):
+	''' Pin roles check; each input and output needs its own pin
+	'''
+	pins = [int(pin) for pin in list(inputs) + list(outputs)]
+	if len(set(pins)) != len(pins):
+		print("Pins used more than once:", inputs, outputs)
+		return False
+	return True
+
+def check_config(config):
+	''' Config file values check; same ranges as the command line.
+		Pin lists must be JSON lists of the right length, with no pin used twice.
+	'''
+	try:
+		for key, count in (("input", 3), ("output", 2)):
+			if key in config:
+				if (not isinstance(config[key], list) or len(config[key]) != count
+						or check_input(config[key]) == False):
+					return False
+		if check_pins(config.get("input", []), config.get("output", [])) == False:
+			return False
+		if ("resolution" in config and check_resolution(config["resolution"]) == False):
+			return False
+		if ("encoder" in config and check_encoder_bounce(config["encoder"]) == False):
+			return False
+		if ("button" in config and check_button_bounce(config["button"]) == False):
+			return False
+		if ("mech" in config and not isinstance(config["mech"], bool)):
+			return False
+	except (TypeError, ValueError):
+		return False
+	return True
+
+def config_settings(trim_encoder, config):
+	''' Validate a config file against the running encoder settings.
+		Returns reconfigure() arguments, or None if any value is not valid
+	'''
+	if (check_config(config) == False):
+		return None
+	settings = trim_encoder.settings()
+	if "input" in config:
+		settings["ip_a"], settings["ip_b"], settings["ip_pb"] = [int(pin) for pin in config["input"]]
+	if "output" in config:
+		settings["op_led"], settings["op_en"] = [int(pin) for pin in config["output"]]
+	if "resolution" in config:
+		settings["enc_resolution"] = int(config["resolution"])
+	if "encoder" in config:
+		settings["enc_bounce"] = int(config["encoder"])
+	if "button" in config:
+		settings["btn_bounce"] = int(config["button"])
+	if "mech" in config:
+		settings["mech"] = config["mech"]
+	# New inputs may land on a running output pin, or the other way round
+	if check_pins([settings["ip_a"], settings["ip_b"], settings["ip_pb"]],
+			[settings["op_led"], settings["op_en"]]) == False:
+		return None
+	return settings
+
 def main():
 	# Need global reference to change global constant
 	global DEBUG
 	global MECH_ENC
+	global START_TIME
 	# Contruct the argument parser and parse the arguments
 	ap = argparse.ArgumentParser(description='Take incremental encoders to output analog voltage via ADC')
 	ap.add_argument("-d", "--debug", action='store_true', required=False,
@@ -265,8 +609,93 @@ def main():
 		help="Encoder Bouncetime in mS (range 0-100). Ignores noise and encoder errors (default: 30)")
 	ap.add_argument("-m", "--mech", action='store_true', required=False,
 		help="Encoder Type, use -m for a mechanical encoder (default: optical encoder)")
+	ap.add_argument("-u", "--unix", required=False,
+		help="GSS server unix socket path for position streaming and control, eg -u /tmp/encoder.sock")
+	ap.add_argument("-p", "--port", required=False,
+		help="GSS server tcp port (range 1-65535) for position streaming and control")
+	ap.add_argument("-j", "--journal", required=False, default=JOURNAL_PATH,
+		help="Position journal file; restores position after restart (default: encoder.journal beside encoder.py)")
+	ap.add_argument("--no-journal", action='store_true', required=False,
+		help="Do not restore or record position; always start at 2048 disabled")
+	ap.add_argument("-c", "--config", required=False,
+		help="JSON config file using the long argument names (input, output, resolution, encoder, button, mech); reloaded live when changed")
+	ap.add_argument("--metrics", required=False,
+		help="Write metrics (eg time to first output) as JSON to this file once a second")
+	ap.add_argument("--supervise", action='store_true', required=False,
+		help="Run under a supervisor that restarts encoder.py on a crash or hang, keeping position")
+	# Supervisor to child plumbing; not for command line use
+	ap.add_argument("--heartbeat-fd", type=int, required=False, help=argparse.SUPPRESS)
+	ap.add_argument("--standby-fd", type=int, required=False, help=argparse.SUPPRESS)
+	ap.add_argument("--start-time", type=float, required=False, help=argparse.SUPPRESS)
+	ap.add_argument("--bind", required=False, default="127.0.0.1",
+		help="GSS server tcp bind address (default: 127.0.0.1). No authentication; other addresses expose trim control to that network")
 	args = vars(ap.parse_args())
 
+	# DAC 1 hardware address
+	dac_1_address = 0x62
+	# RPI I2C may always be bus 1
+	bus_num = 1
+
+	# Started by a supervisor; startup metrics count from its launch
+	if (args["start_time"] != None):
+		START_TIME = args["start_time"]
+
+	if (args["supervise"] == True):
+		# First output from the supervisor itself; the child only repeats it
+		position_journal, start_rotation, start_enabled = restore_output(args, None,
+			dac_1_address, bus_num)
+		if position_journal != None:
+			position_journal.map.close()
+		import supervisor
+		child_argv = [arg for arg in sys.argv[1:] if arg != "--supervise"]
+		supervisor_metrics = None
+		if args["metrics"] != None:
+			supervisor_metrics = os.path.splitext(args["metrics"])[0] + ".supervisor.json"
+		supervisor.supervisor(os.path.abspath(__file__), child_argv,
+			metrics_path=supervisor_metrics, start_time=START_TIME).run()
+		return
+
+	# Hot standby: finish the slow imports, then wait to take over
+	resume = None
+	if (args["standby_fd"] != None):
+		import supervisor
+		import Adafruit_MCP4725
+		import dac_writer
+		import gss_server
+		import config_watch
+		import_gpio()
+		resume = supervisor.wait_standby(args["standby_fd"])
+		# Startup metrics count from promotion, not from the standby launch
+		START_TIME = time.time()
+		if resume == None:
+			return
+		if resume[0] == None:
+			resume = None
+
+	# Restore last position and put it on the DAC before anything else
+	position_journal, start_rotation, start_enabled = restore_output(args, resume,
+		dac_1_address, bus_num)
+
+	# Everything below is not needed for the first output
+	import Adafruit_MCP4725
+	import dac_writer
+	import gss_server
+	import config_watch
+	import_gpio()
+
+	# Config file values replace the command line arguments
+	watcher = None
+	if (args["config"] != None):
+		watcher = config_watch.config_watch(args["config"], None)
+		config = watcher.read()
+		if (config != None and check_config(config) == False):
+			print("Config values not valid...using command line arguments")
+			config = None
+		if config != None:
+			for key in ("input", "output", "resolution", "encoder", "button", "mech"):
+				if key in config:
+					args[key] = config[key]
+
 	if (args["debug"]==True):
 		DEBUG=True
 		print ("DEBUG Enabled...", DEBUG)
@@ -300,6 +729,13 @@ def main():
 		print("..using default i/o pins")
 		encoder_1_led = 17
 		encoder_1_en = 18
+	if (check_pins([encoder_1_a, encoder_1_b, encoder_1_pb], [encoder_1_led, encoder_1_en]) == False):
+		print("..using default i/o pins")
+		encoder_1_a = 5
+		encoder_1_b = 6
+		encoder_1_pb = 23
+		encoder_1_led = 17
+		encoder_1_en = 18
 
 	# Encoder 1 (main encoder) resolution settings
 	if (check_resolution(args["resolution"])== True):
@@ -322,23 +758,83 @@ def main():
 		print("...using default button bouncetime")
 		button_1_bounce = 300;
 
-	# DAC 1 hardware address
-	dac_1_address = 0x62
-	# RPI I2C may always be bus 1
-	bus_num = 1
+	startup = metrics.snapshot()
+	if "journal_restore_ms" in startup:
+		print("restored rotation, enabled:", start_rotation, start_enabled,
+			"in %.1f ms" % startup["journal_restore_ms"])
+	if "first_output_process_ms" in startup:
+		print("time to first output: %.1f ms" % startup["first_output_ms"],
+			"(%.0f ms since process start)" % startup["first_output_process_ms"])
+	elif "first_output_ms" in startup:
+		print("time to first output: %.1f ms" % startup["first_output_ms"])
 
 	trim_encoder_1  = encoder(encoder_1_a, encoder_1_b, encoder_1_pb,
 		encoder_1_led, encoder_1_en, enc_bounce=encoder_1_bounce,
-		btn_bounce=button_1_bounce, enc_resolution=encoder_1_res)
-	dac1 = Adafruit_MCP4725.MCP4725(address=dac_1_address, busnum=bus_num)
+		btn_bounce=button_1_bounce, enc_resolution=encoder_1_res,
+		rotation=start_rotation, enabled=start_enabled)
+	if position_journal != None:
+		position_journal.attach(trim_encoder_1)
+	# DAC writes on their own thread; I2C errors are retried there
+	dac1 = dac_writer.dac_writer(lambda: Adafruit_MCP4725.MCP4725(address=dac_1_address, busnum=bus_num))
+	dac1.write(trim_encoder_1.rotation)
+	trim_encoder_1.add_listener(dac1.encoder_changed)
+	dac1.start()
+
+	# GSS host position streaming and control
+	if (check_port(args["port"]) == True):
+		gss_port = int(args["port"])
+	else:
+		gss_port = None
+	server = None
+	if (args["unix"] != None or gss_port != None):
+		server = gss_server.gss_server(trim_encoder_1, unix_path=args["unix"],
+			tcp_port=gss_port, tcp_host=args["bind"])
+		server.start()
+
+	# Live settings changes; position and DAC output carry on untouched
+	def config_changed(config):
+		settings = config_settings(trim_encoder_1, config)
+		if settings == None:
+			print("Config values not valid...keeping current settings")
+			return
+		try:
+			trim_encoder_1.reconfigure(**settings)
+		except (RuntimeError, ValueError) as e:
+			print("Config not applied, GPIO error...keeping current settings:", e)
+			return
+		print("Config reloaded:", settings)
+	if watcher != None:
+		watcher.on_change = config_changed
+		watcher.start()
+
+	beat = None
+	if (args["heartbeat_fd"] != None):
+		import supervisor
+		beat = supervisor.heartbeat(args["heartbeat_fd"])
 
+	metrics.record("setup_done_ms", (time.time() - START_TIME) * 1000.0)
+	metrics_written = 0
 	try:
 		while(1):
-			dac1.set_voltage(trim_encoder_1.rotation)
+			dac1.write(trim_encoder_1.rotation)
+			# No heartbeat while the writer is stuck; supervisor restarts us
+			if (beat != None and dac1.progress_age() < 1.0):
+				rotation, enabled = trim_encoder_1.get_state()
+				beat.beat(rotation, enabled)
+			if (args["metrics"] != None and time.time() - metrics_written >= 1.0):
+				metrics.write(args["metrics"])
+				metrics_written = time.time()
 			# Delay required to set CPU useage to approx 3%
 			time.sleep(0.01)
 	except KeyboardInterrupt:
 		print("end it!")
+		if watcher != None:
+			watcher.close()
+		if server != None:
+			server.close()
+		if position_journal != None:
+			position_journal.close()
+		dac1.close()
 		GPIO.cleanup()
 
 if __name__=='__main__':
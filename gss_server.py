@@ -0,0 +1,295 @@
+###########################################################################
+#
+# gss_server.py
+# Author:  agent
+# Date:    2026-10-19
+# Repository:
+# https://github.com/jglee72/encoder-dac.git
+# Description: Local control and position streaming for the GSS host.
+#	Serve a unix-domain and/or tcp socket.  There is no authentication;
+#	tcp listens on localhost only unless another address is given.  Every change to the trim
+#	encoder is pushed to all clients as a small binary state frame.  Slow
+#	clients never queue more than one frame; they get the latest state when
+#	their socket drains (intermediate values are dropped, sequence jumps).
+#	Clients may send set point and enable commands; these go through the
+#	same accumulator as the encoder callbacks (encoder.set_rotation and
+#	encoder.set_enabled).
+#
+# Frames are little endian, fixed size:
+#	State   server -> client, 12 bytes '<BBiHI'
+#		type (0x01), flags (bit0 = encoder enabled), position (rotation),
+#		DAC code (0-4095), sequence (increments per published state)
+#	Command client -> server, 6 bytes '<BBi'
+#		type, reserved (0), value
+#		0x10 set point: value = new rotation (clamped 0-4095, ignored
+#			while the encoder is disabled)
+#		0x11 enable: value = 1 enable, 0 disable (pulses GSS HW).  Applied
+#			one at a time by a single worker, at most one per
+#			enable_interval; only the latest pending request is kept.
+#	An unknown command type closes the connection.
+###########################################################################
+import os
+import socket
+import selectors
+import struct
+import threading
+import time
+
+STATE_FRAME = struct.Struct('<BBiHI')
+COMMAND_FRAME = struct.Struct('<BBi')
+
+FRAME_STATE = 0x01
+FLAG_ENABLED = 0x01
+
+CMD_SET_POINT = 0x10
+CMD_ENABLE = 0x11
+
+def dac_code(rotation):
+	''' Code the DAC will output for a rotation; MCP4725 clamps to 12-bit
+	'''
+	return min(max(rotation, 0), 4095)
+
+def pack_state(rotation, enabled, sequence):
+	flags = FLAG_ENABLED if enabled else 0
+	return STATE_FRAME.pack(FRAME_STATE, flags, rotation, dac_code(rotation), sequence)
+
+def pack_command(command, value):
+	return COMMAND_FRAME.pack(command, 0, int(value))
+
+class client (object):
+	''' Per connection buffers.  outbuf holds at most one (partly sent) frame
+	'''
+	def __init__(self, sock):
+		self.sock = sock
+		self.inbuf = bytearray()
+		self.outbuf = bytearray()
+		self.dirty = False
+
+class gss_server (object):
+	''' Socket server for one encoder.  Runs its own selector loop thread;
+		the encoder listener only wakes that loop, so GPIO callbacks never
+		touch a socket.
+	'''
+	def __init__(self, trim_encoder, unix_path=None, tcp_port=None, tcp_host='127.0.0.1', enable_interval=0.3):
+		self.encoder = trim_encoder
+		self.unix_path = unix_path
+		self.selector = selectors.DefaultSelector()
+		self.clients = {}
+		self.state = None
+		self.sequence = 0
+		self.running = False
+		self.thread = None
+		# Enable commands; one worker so GSS pulses stay in step
+		self.enable_interval = enable_interval
+		self.enable_pending = None
+		self.enable_event = threading.Event()
+		self.closing = threading.Event()
+		self.enable_thread = threading.Thread(target=self.enable_worker, name="gss_enable")
+		self.enable_thread.daemon = True
+		self.enable_thread.start()
+		# Self pipe; a full pipe means a wake up is already pending
+		self.wake_r, self.wake_w = os.pipe()
+		os.set_blocking(self.wake_r, False)
+		os.set_blocking(self.wake_w, False)
+		self.selector.register(self.wake_r, selectors.EVENT_READ, self.handle_wake)
+		self.listen_socks = []
+		if unix_path != None:
+			if os.path.exists(unix_path):
+				os.unlink(unix_path)
+			sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			sock.bind(unix_path)
+			self.listen(sock)
+		if tcp_port != None:
+			sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+			sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+			sock.bind((tcp_host, tcp_port))
+			self.listen(sock)
+		trim_encoder.add_listener(self.encoder_changed)
+
+	def listen(self, sock):
+		sock.listen(8)
+		sock.setblocking(False)
+		self.listen_socks.append(sock)
+		self.selector.register(sock, selectors.EVENT_READ, self.handle_accept)
+
+	def address(self):
+		''' Bound addresses, useful when tcp_port=0 picked a free port
+		'''
+		return [sock.getsockname() for sock in self.listen_socks]
+
+	def start(self):
+		self.running = True
+		self.thread = threading.Thread(target=self.serve_forever, name="gss_server")
+		self.thread.daemon = True
+		self.thread.start()
+
+	def close(self):
+		self.running = False
+		self.closing.set()
+		self.enable_event.set()
+		self.wake()
+		if self.thread != None and self.thread is not threading.current_thread():
+			self.thread.join(1.0)
+
+	def serve_forever(self):
+		self.running = True
+		try:
+			while self.running:
+				for key, events in self.selector.select():
+					key.data(key.fileobj, events)
+		finally:
+			self.shutdown()
+
+	def shutdown(self):
+		for c in list(self.clients.values()):
+			self.drop(c)
+		for sock in self.listen_socks:
+			self.selector.unregister(sock)
+			sock.close()
+		self.listen_socks = []
+		if self.unix_path != None and os.path.exists(self.unix_path):
+			os.unlink(self.unix_path)
+		self.selector.unregister(self.wake_r)
+		os.close(self.wake_r)
+		os.close(self.wake_w)
+		self.selector.close()
+
+	def wake(self):
+		try:
+			os.write(self.wake_w, b'\0')
+		except (BlockingIOError, OSError):
+			pass
+
+	def encoder_changed(self, rotation, enabled):
+		''' Encoder listener; runs on the GPIO callback thread
+		'''
+		self.wake()
+
+	def handle_wake(self, fd, events):
+		try:
+			while os.read(fd, 512):
+				pass
+		except BlockingIOError:
+			pass
+		self.publish()
+
+	def publish(self):
+		''' Send the latest encoder state to every client if it changed
+		'''
+		state = self.encoder.get_state()
+		if state == self.state:
+			return
+		self.state = state
+		self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+		for c in list(self.clients.values()):
+			self.queue_state(c)
+
+	def queue_state(self, c):
+		if c.outbuf:
+			# Slow consumer: latest state goes out once the frame drains
+			c.dirty = True
+			return
+		c.outbuf += pack_state(self.state[0], self.state[1], self.sequence)
+		self.flush(c)
+
+	def flush(self, c):
+		while c.outbuf:
+			try:
+				sent = c.sock.send(c.outbuf)
+			except BlockingIOError:
+				break
+			except OSError:
+				self.drop(c)
+				return
+			del c.outbuf[:sent]
+			if not c.outbuf and c.dirty:
+				c.dirty = False
+				c.outbuf += pack_state(self.state[0], self.state[1], self.sequence)
+		events = selectors.EVENT_READ
+		if c.outbuf:
+			events |= selectors.EVENT_WRITE
+		self.selector.modify(c.sock, events, self.handle_client)
+
+	def handle_accept(self, sock, events):
+		try:
+			conn, addr = sock.accept()
+		except BlockingIOError:
+			return
+		conn.setblocking(False)
+		if conn.family != socket.AF_UNIX:
+			conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		c = client(conn)
+		self.selector.register(conn, selectors.EVENT_READ, self.handle_client)
+		self.publish()
+		self.clients[conn.fileno()] = c
+		# New clients get the current state straight away
+		self.queue_state(c)
+
+	def handle_client(self, sock, events):
+		c = self.clients.get(sock.fileno())
+		if c == None:
+			return
+		if events & selectors.EVENT_WRITE:
+			self.flush(c)
+			if sock.fileno() not in self.clients:
+				return
+		if events & selectors.EVENT_READ:
+			self.handle_read(c)
+
+	def handle_read(self, c):
+		try:
+			data = c.sock.recv(4096)
+		except BlockingIOError:
+			return
+		except OSError:
+			data = b''
+		if not data:
+			self.drop(c)
+			return
+		c.inbuf += data
+		while len(c.inbuf) >= COMMAND_FRAME.size:
+			command, reserved, value = COMMAND_FRAME.unpack_from(c.inbuf)
+			del c.inbuf[:COMMAND_FRAME.size]
+			if self.command(command, value) == False:
+				self.drop(c)
+				return
+
+	def command(self, command, value):
+		''' Apply a client command; False for an unknown command type
+		'''
+		if command == CMD_SET_POINT:
+			self.encoder.set_rotation(value)
+		elif command == CMD_ENABLE:
+			# set_enabled pulses GSS HW (sleeps); keep it off the server loop
+			self.enable_pending = (value != 0)
+			self.enable_event.set()
+		else:
+			return False
+		return True
+
+	def enable_worker(self):
+		''' Apply the latest enable request, at most one per enable_interval
+		'''
+		last = 0
+		while not self.closing.is_set():
+			self.enable_event.wait()
+			self.enable_event.clear()
+			wait = last + self.enable_interval - time.time()
+			if wait > 0 and self.closing.wait(wait):
+				break
+			enabled = self.enable_pending
+			self.enable_pending = None
+			if enabled == None:
+				continue
+			self.encoder.set_enabled(enabled)
+			last = time.time()
+
+	def drop(self, c):
+		fd = c.sock.fileno()
+		if fd in self.clients:
+			del self.clients[fd]
+		try:
+			self.selector.unregister(c.sock)
+		except (KeyError, ValueError):
+			pass
+		c.sock.close()
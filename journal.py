@@ -0,0 +1,124 @@
+###########################################################################
+#
+# journal.py
+# Author:  agent
+# Date:    2026-10-19
+# Repository:
+# https://github.com/jglee72/encoder-dac.git
+# Description: Crash safe position journal for the trim encoder.
+#	A small fixed-size file, memory mapped, holding SLOTS records of
+#	rotation and enable state.  Each record has a sequence number and a
+#	crc32; records are written round robin so the newest good record is
+#	never overwritten.  A torn write (power loss mid record) fails its crc
+#	and load() falls back to the previous record.
+#	Writes happen on a journal thread at most once per interval; the
+#	encoder listener only sets an event so edge decoding never waits on
+#	the SD card.
+###########################################################################
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+MAGIC = 0x4A434E45		# 'ENCJ'
+# magic, sequence, rotation, enabled, crc32 of the preceding 16 bytes
+SLOT = struct.Struct('<IIiB3xI')
+SLOTS = 8
+SIZE = SLOT.size * SLOTS
+
+class journal (object):
+	''' Position journal.  load() once at startup, then attach() to an encoder
+	'''
+	def __init__(self, path, interval=0.1):
+		self.path = path
+		self.interval = interval
+		self.sequence = 0
+		self.last = None
+		self.event = threading.Event()
+		self.closing = threading.Event()
+		self.thread = None
+		self.trim_encoder = None
+		fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+		try:
+			if os.fstat(fd).st_size != SIZE:
+				# New or foreign file; start empty
+				os.ftruncate(fd, 0)
+				os.ftruncate(fd, SIZE)
+			self.map = mmap.mmap(fd, SIZE)
+		finally:
+			os.close(fd)
+
+	def load(self):
+		''' Newest valid (rotation, enabled) record, or None for an empty journal
+		'''
+		best = None
+		for i in range(SLOTS):
+			magic, sequence, rotation, enabled, crc = SLOT.unpack_from(self.map, i * SLOT.size)
+			if magic != MAGIC:
+				continue
+			if zlib.crc32(self.map[i * SLOT.size:i * SLOT.size + SLOT.size - 4]) != crc:
+				continue
+			if best == None or sequence > best[0]:
+				best = (sequence, rotation, enabled != 0)
+		if best == None:
+			return None
+		self.sequence = best[0]
+		self.last = (best[1], best[2])
+		return self.last
+
+	def record(self, rotation, enabled):
+		''' Write one record to the next slot and sync it to disk
+		'''
+		if (rotation, enabled) == self.last:
+			return
+		self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+		offset = (self.sequence % SLOTS) * SLOT.size
+		body = SLOT.pack(MAGIC, self.sequence, rotation, 1 if enabled else 0, 0)[:-4]
+		self.map[offset:offset + SLOT.size] = body + struct.pack('<I', zlib.crc32(body))
+		self.map.flush()
+		self.last = (rotation, enabled)
+
+	def attach(self, trim_encoder):
+		''' Follow an encoder's state from a background thread
+		'''
+		self.trim_encoder = trim_encoder
+		trim_encoder.add_listener(self.encoder_changed)
+		self.thread = threading.Thread(target=self.run, name="journal")
+		self.thread.daemon = True
+		self.thread.start()
+		self.event.set()
+
+	def encoder_changed(self, rotation, enabled):
+		''' Encoder listener; runs on the GPIO callback thread
+		'''
+		self.event.set()
+
+	def run(self):
+		while not self.closing.is_set():
+			self.event.wait()
+			self.event.clear()
+			self.record_state()
+			# Bound the write rate; later changes coalesce into one record
+			self.closing.wait(self.interval)
+
+	def close(self):
+		''' Stop the journal thread, write the final state and unmap
+		'''
+		self.closing.set()
+		self.event.set()
+		if self.thread != None:
+			self.thread.join(1.0)
+		if self.trim_encoder != None:
+			self.record_state()
+		self.map.close()
+
+	def record_state(self):
+		''' Record the encoder's current state.  A write error (SD card full
+			or read only) is printed and the next change tries again.
+		'''
+		rotation, enabled = self.trim_encoder.get_state()
+		try:
+			self.record(rotation, enabled)
+		except (IOError, OSError, ValueError) as e:
+			print("Position journal write failed:", e)
@@ -0,0 +1,37 @@
+###########################################################################
+#
+# metrics.py
+# Author:  agent
+# Date:    2026-10-19
+# Repository:
+# https://github.com/jglee72/encoder-dac.git
+# Description: Process wide metrics for encoder.py (startup time, faults).
+#	Values are plain numbers keyed by name.  write() saves them as JSON,
+#	replacing the file in one rename so readers never see a partial file.
+###########################################################################
+import os
+import threading
+
+VALUES = {}
+LOCK = threading.Lock()
+
+def record(name, value):
+	with LOCK:
+		VALUES[name] = value
+
+def incr(name, amount=1):
+	with LOCK:
+		VALUES[name] = VALUES.get(name, 0) + amount
+
+def snapshot():
+	with LOCK:
+		return dict(VALUES)
+
+def write(path):
+	''' Save a snapshot of all metrics to path as JSON
+	'''
+	import json
+	tmp = path + ".tmp"
+	with open(tmp, "w") as f:
+		json.dump(snapshot(), f, sort_keys=True)
+	os.rename(tmp, path)
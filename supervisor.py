@@ -0,0 +1,266 @@
+###########################################################################
+#
+# supervisor.py
+# Author:  agent
+# Date:    2026-10-19
+# Repository:
+# https://github.com/jglee72/encoder-dac.git
+# Description: Keep encoder.py running; used by 'encoder.py --supervise'.
+#	The supervisor runs encoder.py as a child and reads a heartbeat pipe
+#	written from the DAC writer loop.  Each heartbeat carries the current
+#	rotation and enable state.  If the child exits, or no heartbeat arrives
+#	within stall_timeout (eg hung on I2C), it is killed and replaced.
+#	A hot standby child is kept with all imports done, waiting on a pipe;
+#	on failure it is sent the last known position and takes over.  The
+#	standby is only started once the active child has sent its first
+#	heartbeat, so its imports do not slow the active child's first output.
+#	A child that does not die (eg stuck in an I2C call) is not waited for;
+#	it is reaped later.  The DAC holds its last code in the meantime.
+#	Metrics: restart_latency_ms (failure seen -> first heartbeat from the
+#	new child) and output_gap_ms (last heartbeat of the old child -> first
+#	heartbeat of the new one, including the stall_timeout wait), each
+#	with a max.
+#
+# Pipes carry fixed size little endian frames:
+#	Heartbeat child -> supervisor '<iB'  rotation, enabled
+#	Resume    supervisor -> standby '<iBB' rotation, enabled, valid
+#		valid = 0 means no position known; the child uses its journal
+###########################################################################
+import os
+import select
+import signal
+import struct
+import subprocess
+import sys
+import time
+import metrics
+
+HEARTBEAT = struct.Struct('<iB')
+RESUME = struct.Struct('<iBB')
+
+class heartbeat (object):
+	''' Child side heartbeat; beat() from the writer loop, rate limited
+	'''
+	def __init__(self, fd, interval=0.1):
+		self.fd = fd
+		self.interval = interval
+		self.last = 0
+		os.set_blocking(fd, False)
+
+	def beat(self, rotation, enabled):
+		now = time.time()
+		if now - self.last < self.interval:
+			return
+		self.last = now
+		try:
+			os.write(self.fd, HEARTBEAT.pack(rotation, 1 if enabled else 0))
+		except (BlockingIOError, OSError):
+			# Pipe full or supervisor gone; keep driving the DAC regardless
+			pass
+
+def wait_standby(fd):
+	''' Child side; block until promoted.  Returns (rotation, enabled),
+		(None, None) if no position is known, or None if the supervisor
+		closed the pipe (standby no longer needed).
+	'''
+	data = b''
+	while len(data) < RESUME.size:
+		chunk = os.read(fd, RESUME.size - len(data))
+		if not chunk:
+			return None
+		data += chunk
+	os.close(fd)
+	rotation, enabled, valid = RESUME.unpack(data)
+	if valid == 0:
+		return (None, None)
+	return (rotation, enabled != 0)
+
+class child (object):
+	''' One encoder.py process and its pipes
+	'''
+	def __init__(self, script, argv, standby):
+		hb_r, hb_w = os.pipe()
+		fds = [hb_w]
+		args = [sys.executable, script] + argv + ["--heartbeat-fd", str(hb_w)]
+		self.go_fd = None
+		go_r = None
+		if standby:
+			go_r, self.go_fd = os.pipe()
+			fds.append(go_r)
+			args += ["--standby-fd", str(go_r)]
+		self.proc = subprocess.Popen(args, pass_fds=fds)
+		os.close(hb_w)
+		if go_r != None:
+			os.close(go_r)
+		self.hb_fd = hb_r
+		os.set_blocking(hb_r, False)
+		self.buffer = b''
+		self.started = time.time()
+		self.last_beat = None
+
+	def promote(self, rotation, enabled):
+		if rotation == None:
+			frame = RESUME.pack(0, 0, 0)
+		else:
+			frame = RESUME.pack(rotation, 1 if enabled else 0, 1)
+		os.write(self.go_fd, frame)
+		os.close(self.go_fd)
+		self.go_fd = None
+		# Start the stall clock from promotion, not from standby launch
+		self.started = time.time()
+
+	def read_beats(self):
+		''' Latest (rotation, enabled) from the heartbeat pipe, or None
+		'''
+		state = None
+		try:
+			while True:
+				chunk = os.read(self.hb_fd, 4096)
+				if not chunk:
+					break
+				self.buffer += chunk
+		except BlockingIOError:
+			pass
+		while len(self.buffer) >= HEARTBEAT.size:
+			rotation, enabled = HEARTBEAT.unpack_from(self.buffer)
+			self.buffer = self.buffer[HEARTBEAT.size:]
+			state = (rotation, enabled != 0)
+		if state != None:
+			self.last_beat = time.time()
+		return state
+
+	def stop(self, sig=signal.SIGKILL, timeout=1.0):
+		''' Signal the child and wait at most timeout (twice if it has to be
+			killed).  Returns False if it is still running; poll it later.
+		'''
+		if self.go_fd != None:
+			# Standby exits when its pipe closes
+			os.close(self.go_fd)
+			self.go_fd = None
+		if self.hb_fd != None:
+			os.close(self.hb_fd)
+			self.hb_fd = None
+		if self.proc.poll() == None:
+			self.proc.send_signal(sig)
+			try:
+				self.proc.wait(timeout)
+			except subprocess.TimeoutExpired:
+				# A process in an uninterruptible syscall ignores even SIGKILL
+				self.proc.kill()
+				try:
+					self.proc.wait(timeout)
+				except subprocess.TimeoutExpired:
+					return False
+		return True
+
+class supervisor (object):
+	''' Run encoder.py argv under watch with a hot standby
+	'''
+	def __init__(self, script, argv, stall_timeout=1.0, start_timeout=15.0, restart_interval=1.0, metrics_path=None,
+			start_time=None, kill_timeout=0.1):
+		self.script = script
+		self.argv = argv
+		# Supervisor launch time, passed to the first child for its metrics
+		self.start_time = start_time
+		# Longest wait for a failed child to die before the standby takes over
+		self.kill_timeout = kill_timeout
+		self.stall_timeout = stall_timeout
+		self.start_timeout = start_timeout
+		# Minimum time between restarts; stops a crash loop spinning
+		self.restart_interval = restart_interval
+		self.last_restart = 0
+		self.metrics_path = metrics_path
+		self.state = (None, None)
+		self.failed_at = None
+		self.failed_last_beat = None
+		self.active = None
+		self.standby = None
+		# Killed children not yet exited
+		self.dying = []
+
+	def run(self):
+		argv = self.argv
+		if self.start_time != None:
+			argv = argv + ["--start-time", repr(self.start_time)]
+		self.active = child(self.script, argv, False)
+		metrics.record("restarts", 0)
+		self.write_metrics()
+		try:
+			while True:
+				self.poll()
+		except KeyboardInterrupt:
+			print("supervisor: end it!")
+		finally:
+			if self.standby != None:
+				self.standby.stop()
+			# SIGINT lets the active child clean up its GPIO
+			self.active.stop(signal.SIGINT)
+
+	def poll(self):
+		select.select([self.active.hb_fd], [], [], 0.05)
+		state = self.active.read_beats()
+		now = time.time()
+		if state != None:
+			self.state = state
+			if self.failed_at != None:
+				latency = (now - self.failed_at) * 1000.0
+				self.failed_at = None
+				print("supervisor: restarted in %.1f ms" % latency)
+				self.record_max("restart_latency_ms", latency)
+				if self.failed_last_beat != None:
+					gap = (now - self.failed_last_beat) * 1000.0
+					self.failed_last_beat = None
+					print("supervisor: no output updates for %.1f ms" % gap)
+					self.record_max("output_gap_ms", gap)
+				self.write_metrics()
+		if self.active.proc.poll() != None:
+			self.restart("exited with %s" % self.active.proc.returncode)
+		elif self.active.last_beat == None:
+			if now - self.active.started > self.start_timeout:
+				self.restart("no heartbeat after start")
+		elif now - self.active.last_beat > self.stall_timeout:
+			self.restart("heartbeat stalled")
+		if self.standby == None:
+			# Not before the active child is up; keep its first output fast
+			if self.active.last_beat != None:
+				self.standby = child(self.script, self.argv, True)
+		elif self.standby.proc.poll() != None:
+			print("supervisor: standby exited, starting another")
+			self.standby.stop()
+			self.standby = child(self.script, self.argv, True)
+		self.dying = [old for old in self.dying if old.proc.poll() == None]
+
+	def restart(self, reason):
+		self.failed_at = time.time()
+		# Output stopped updating at the last heartbeat, not at detection
+		if self.active.last_beat != None:
+			self.failed_last_beat = self.active.last_beat
+		wait = self.last_restart + self.restart_interval - self.failed_at
+		if wait > 0:
+			time.sleep(wait)
+		self.last_restart = time.time()
+		print("supervisor: encoder", reason, "- handing over at rotation, enabled:",
+			self.state[0], self.state[1])
+		metrics.incr("restarts")
+		if not self.active.stop(timeout=self.kill_timeout):
+			print("supervisor: encoder pid", self.active.proc.pid, "not dead yet, handing over anyway")
+			self.dying.append(self.active)
+		if self.standby != None and self.standby.proc.poll() != None:
+			self.standby.stop()
+			self.standby = None
+		if self.standby == None:
+			# No standby ready; a new one takes over once its imports are done
+			self.standby = child(self.script, self.argv, True)
+		self.active = self.standby
+		self.active.promote(self.state[0], self.state[1])
+		self.standby = None
+		self.write_metrics()
+
+	def record_max(self, name, value):
+		metrics.record(name, value)
+		metrics.record(name.replace("_ms", "_max_ms"), max(value,
+			metrics.snapshot().get(name.replace("_ms", "_max_ms"), 0)))
+
+	def write_metrics(self):
+		if self.metrics_path != None:
+			metrics.write(self.metrics_path)
@@ -0,0 +1,53 @@
+# Test setup: stub RPi.GPIO so encoder.py imports without a Raspberry Pi.
+# The stub records calls and lets tests set input levels and fire callbacks.
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def make_gpio():
+	gpio = types.ModuleType("RPi.GPIO")
+	gpio.BCM = 11
+	gpio.OUT = 0
+	gpio.IN = 1
+	gpio.FALLING = 32
+	gpio.BOTH = 33
+	gpio.calls = []
+	gpio.levels = {}
+	gpio.events = {}
+	def setmode(mode):
+		gpio.calls.append(("setmode", mode))
+	def setup(pin, direction):
+		gpio.calls.append(("setup", pin, direction))
+	def output(pin, value):
+		gpio.calls.append(("output", pin, value))
+		gpio.levels[pin] = 1 if value else 0
+	def input(pin):
+		return gpio.levels.get(pin, 0)
+	def add_event_detect(pin, edge, callback, bouncetime):
+		gpio.calls.append(("add_event_detect", pin, edge, bouncetime))
+		gpio.events[pin] = (edge, callback, bouncetime)
+	def remove_event_detect(pin):
+		gpio.calls.append(("remove_event_detect", pin))
+		del gpio.events[pin]
+	def cleanup(pin=None):
+		gpio.calls.append(("cleanup", pin))
+	for f in (setmode, setup, output, input, add_event_detect, remove_event_detect, cleanup):
+		setattr(gpio, f.__name__, f)
+	return gpio
+
+@pytest.fixture
+def gpio(monkeypatch):
+	''' Fresh stub RPi.GPIO, also installed as encoder.GPIO
+	'''
+	stub = make_gpio()
+	package = types.ModuleType("RPi")
+	package.GPIO = stub
+	monkeypatch.setitem(sys.modules, "RPi", package)
+	monkeypatch.setitem(sys.modules, "RPi.GPIO", stub)
+	import encoder
+	monkeypatch.setattr(encoder, "GPIO", stub)
+	return stub
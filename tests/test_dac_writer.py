@@ -0,0 +1,180 @@
+import threading
+import time
+
+import pytest
+
+import dac_writer
+import metrics
+
+@pytest.fixture(autouse=True)
+def clean_metrics(monkeypatch):
+	monkeypatch.setattr(metrics, "VALUES", {})
+
+class fake_dac (object):
+	''' MCP4725 stand in; raises IOError while failing is set
+	'''
+	def __init__(self):
+		self.failing = threading.Event()
+		self.values = []
+		self.attempts = 0
+
+	def set_voltage(self, value):
+		self.attempts += 1
+		if self.failing.is_set():
+			raise IOError(121, "Remote I/O error")
+		self.values.append(value)
+
+def wait_for(condition, timeout=2.0):
+	end = time.time() + timeout
+	while not condition():
+		if time.time() > end:
+			return False
+		time.sleep(0.005)
+	return True
+
+def make_writer(dac, opens=None, **kwargs):
+	def open_dac():
+		if opens != None:
+			opens.append(time.time())
+		return dac
+	kwargs.setdefault("recover_bus", None)
+	return dac_writer.dac_writer(open_dac, **kwargs)
+
+def test_open_failure_at_startup_retried():
+	dac = fake_dac()
+	attempts = []
+	def open_dac():
+		attempts.append(1)
+		if len(attempts) < 4:
+			raise IOError(2, "No such file or directory")
+		return dac
+	writer = dac_writer.dac_writer(open_dac, recover_bus=None)
+	writer.write(100)
+	writer.start()
+	assert wait_for(lambda: dac.values)
+	writer.close()
+	assert dac.values[0] == 100
+	assert len(attempts) == 4
+	assert metrics.snapshot()["i2c_failures"] == 3
+
+def test_only_latest_code_after_fault():
+	dac = fake_dac()
+	writer = make_writer(dac, backoff_max=0.01)
+	writer.write(1)
+	writer.start()
+	assert wait_for(lambda: dac.values == [1])
+	dac.failing.set()
+	writer.write(2)
+	assert wait_for(lambda: dac.attempts > 2)
+	for value in range(3, 50):
+		writer.write(value)
+		time.sleep(0.001)
+	writer.write(5000)
+	time.sleep(0.02)
+	dac.failing.clear()
+	assert wait_for(lambda: len(dac.values) == 2)
+	time.sleep(0.05)
+	writer.close()
+	# Clamped to the 12-bit range; nothing in between was written
+	assert dac.values == [1, 4095]
+	values = metrics.snapshot()
+	assert values["i2c_failures"] > 0
+	assert values["dac_values_dropped"] > 0
+	assert values["i2c_fault_ms"] >= 20
+	assert values["i2c_fault_max_ms"] == values["i2c_fault_ms"]
+
+def test_reopen_after_retry_timeout():
+	dac = fake_dac()
+	opens = []
+	recoveries = []
+	writer = make_writer(dac, opens, retry_timeout=0.05, backoff_max=0.01,
+		recover_after=2, recover_bus=lambda: recoveries.append(1) or True)
+	dac.failing.set()
+	writer.write(7)
+	writer.start()
+	assert wait_for(lambda: metrics.snapshot().get("i2c_reopens", 0) >= 4)
+	dac.failing.clear()
+	assert wait_for(lambda: dac.values == [7])
+	writer.close()
+	# Each reopen opens the device again
+	assert len(opens) >= 5
+	assert opens[1] - opens[0] >= 0.05
+	# Bus recovery every second reopen in a row
+	values = metrics.snapshot()
+	assert values["i2c_bus_recoveries"] == len(recoveries) == values["i2c_reopens"] // 2
+	assert "i2c_bus_stuck" not in values
+
+def test_bus_recovery_not_available():
+	dac = fake_dac()
+	def recover_bus():
+		raise OSError(2, "No such file or directory: '/dev/gpiomem'")
+	writer = make_writer(dac, retry_timeout=0.01, backoff_max=0.005,
+		recover_after=1, recover_bus=recover_bus)
+	dac.failing.set()
+	writer.write(9)
+	writer.start()
+	assert wait_for(lambda: metrics.snapshot().get("i2c_bus_recoveries", 0) >= 2)
+	dac.failing.clear()
+	assert wait_for(lambda: dac.values == [9])
+	writer.close()
+
+class fake_registers (object):
+	''' GPIO block with a slave holding SDA low for held SCL clocks.
+		Outputs drive low only (GPCLR), inputs read high through the pull up.
+	'''
+	def __init__(self, held):
+		self.fsel = {dac_writer.SDA: dac_writer.FSEL_ALT0, dac_writer.SCL: dac_writer.FSEL_ALT0}
+		self.held = held
+		self.clocks = 0
+		self.cleared = 0
+		self.trace = []
+
+	def line(self, pin):
+		if self.fsel[pin] == dac_writer.FSEL_OUTPUT:
+			assert self.cleared & (1 << pin), "pin driven high"
+			return 0
+		if pin == dac_writer.SDA and self.clocks < self.held:
+			return 0
+		return 1
+
+	def read(self, offset):
+		if offset == dac_writer.GPLEV0:
+			return sum(self.line(pin) << pin for pin in self.fsel)
+		assert offset == dac_writer.GPFSEL0
+		return sum(self.fsel[pin] << (pin * 3) for pin in self.fsel)
+
+	def write(self, offset, value):
+		if offset == dac_writer.GPCLR0:
+			self.cleared |= value
+			return
+		assert offset == dac_writer.GPFSEL0
+		for pin in self.fsel:
+			function = (value >> (pin * 3)) & 7
+			if pin == dac_writer.SCL and function == dac_writer.FSEL_OUTPUT and self.fsel[pin] != function:
+				self.clocks += 1
+			if self.fsel[pin] != function:
+				self.trace.append((pin, self.line(dac_writer.SCL), function))
+			self.fsel[pin] = function
+
+def test_bus_recover_clocks_until_sda_released():
+	regs = fake_registers(held=3)
+	assert dac_writer.bus_recover(regs, half_period=0) == True
+	# 3 clocks and the STOP's
+	assert regs.clocks == 4
+	# STOP: SDA released while SCL is high
+	sda = [entry for entry in regs.trace if entry[0] == dac_writer.SDA]
+	assert sda[-2:] == [(dac_writer.SDA, 1, dac_writer.FSEL_INPUT), (dac_writer.SDA, 1, dac_writer.FSEL_ALT0)]
+	assert regs.fsel == {dac_writer.SDA: dac_writer.FSEL_ALT0, dac_writer.SCL: dac_writer.FSEL_ALT0}
+
+def test_bus_recover_gives_up_after_nine_clocks():
+	regs = fake_registers(held=100)
+	assert dac_writer.bus_recover(regs, half_period=0) == False
+	# 9 clocks then the STOP's SCL low; pins still returned to I2C
+	assert regs.clocks == 10
+	assert regs.fsel == {dac_writer.SDA: dac_writer.FSEL_ALT0, dac_writer.SCL: dac_writer.FSEL_ALT0}
+
+def test_bus_recover_free_bus():
+	regs = fake_registers(held=0)
+	assert dac_writer.bus_recover(regs, half_period=0) == True
+	# Only the STOP
+	assert regs.clocks == 1
@@ -0,0 +1,97 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+import edge_analysis
+
+MS = 1000000
+
+def capture():
+	''' Quadrature at 10 ms per change; one A bounce burst at 20 ms and one
+		illegal (both changed) transition at 50 ms
+	'''
+	t = np.array([0, 10, 20, 20.1, 20.2, 30, 40, 50, 60, 70]) * MS
+	a = [0, 0, 1, 0, 1, 1, 0, 1, 1, 0]
+	b = [0, 1, 1, 1, 1, 0, 0, 1, 0, 0]
+	return t.astype(np.int64), a, b
+
+def test_analyse_known_capture():
+	report = edge_analysis.analyse(*capture())
+	assert report["events"] == 10
+	assert report["illegal"] == 1
+	assert report["both_changed"] == 1
+	assert report["no_change"] == 0
+	assert report["bounce_bursts"] == 1
+	assert report["bounce_edges"] == 2
+	assert report["bounce_edges_max"] == 3
+	assert report["bounce"]["p99"] == pytest.approx(0.2)
+	assert report["pulse_b_clean"]["min"] == pytest.approx(20.0)
+
+def test_analyse_unsorted_and_float_seconds():
+	t, a, b = capture()
+	order = np.arange(len(t))[::-1]
+	report = edge_analysis.analyse(t[order] / 1e9, np.asarray(a)[order], np.asarray(b)[order])
+	assert report["illegal"] == 1
+	assert report["bounce_bursts"] == 1
+
+def test_analyse_length_mismatch():
+	t, a, b = capture()
+	with pytest.raises(ValueError):
+		edge_analysis.analyse(t, a[:-1], b)
+
+def test_from_pin_edges():
+	t, a, b = edge_analysis.from_pin_edges([1, 2, 3, 4], [1, 0, 1, 0], [1, 1, 0, 0])
+	assert list(a) == [0, 1, 1, 0]
+	assert list(b) == [1, 1, 0, 0]
+
+def test_recommend_floor_is_one():
+	settings = edge_analysis.recommend({"bounce": {"count": 0}})
+	assert settings["encoder"] == 1
+	# Bounce longer than half the shortest pulse: capped there, never under 1
+	settings = edge_analysis.recommend({"bounce": {"count": 5, "p99": 2.0},
+		"pulse_a_clean": {"count": 5, "p1": 1.5}})
+	assert settings["encoder"] == 1
+	assert any("RC filter" in note for note in settings["notes"])
+
+def test_recommend_mech_from_waveform_only():
+	noisy = {"bounce": {"count": 0}, "a_high_fraction": 0.5, "illegal_rate": 0.2}
+	settings = edge_analysis.recommend(noisy)
+	assert settings["mech"] == False
+	assert any("noisy" in note for note in settings["notes"])
+	assert edge_analysis.recommend({"bounce": {"count": 0}, "a_high_fraction": 0.1})["mech"] == True
+
+def test_recommend_synthetic_capture():
+	report = edge_analysis.analyse(*edge_analysis.synthetic_capture(20000))
+	assert report["illegal"] == 0
+	assert report["bounce_bursts"] > 0
+	settings = edge_analysis.recommend(report)
+	assert 1 <= settings["encoder"] <= 100
+	assert settings["mech"] == False
+	# Ideal quadrature with changing speed is not a phase error
+	assert report["phase_error_deg"]["p95"] < 10
+	assert not any("phase error" in note for note in settings["notes"])
+
+def quadrature(half_cycles_ms, b_fraction):
+	''' Forward quadrature; B changes b_fraction into each A half cycle
+	'''
+	half = np.asarray(half_cycles_ms, dtype=np.float64) * MS
+	fraction = np.broadcast_to(b_fraction, half.shape)
+	gaps = np.column_stack((half * fraction, half * (1 - fraction))).ravel()
+	t = np.concatenate(([0], np.cumsum(gaps))).astype(np.int64)
+	gray = np.array([0, 1, 3, 2], dtype=np.uint8)
+	state = gray[np.arange(len(t)) % 4]
+	return t, (state >> 1) & 1, state & 1
+
+def test_phase_error_at_steady_speed():
+	report = edge_analysis.analyse(*quadrature(np.full(200, 4.0), 0.2))
+	assert report["phase_error_deg"]["p95"] == pytest.approx(54.0)
+	assert report["phase_error_deg"]["mean_signed"] == pytest.approx(-54.0)
+	settings = edge_analysis.recommend(report)
+	assert any("phase error" in note for note in settings["notes"])
+
+def test_phase_skips_speed_changes():
+	# Speed jumps 4x every half cycle: nothing steady to measure against
+	report = edge_analysis.analyse(*quadrature(np.tile([2.0, 8.0], 100), 0.1))
+	assert "phase_error_deg" not in report
+	assert report["phase_unsteady"] > 0
+	settings = edge_analysis.recommend(report)
+	assert not any("phase error" in note for note in settings["notes"])
@@ -0,0 +1,220 @@
+import encoder
+
+def make_encoder(gpio):
+	trim_encoder = encoder.encoder()
+	del gpio.calls[:]
+	return trim_encoder
+
+def reconfigure(trim_encoder, **changes):
+	settings = trim_encoder.settings()
+	settings.update(changes)
+	trim_encoder.reconfigure(**settings)
+
+def test_unchanged_settings_touch_nothing(gpio):
+	trim_encoder = make_encoder(gpio)
+	reconfigure(trim_encoder)
+	assert gpio.calls == []
+
+def test_encoder_bouncetime_only_reregisters_a_b(gpio):
+	trim_encoder = make_encoder(gpio)
+	reconfigure(trim_encoder, enc_bounce=5)
+	assert sorted(gpio.calls) == sorted([
+		("remove_event_detect", 5), ("remove_event_detect", 6),
+		("add_event_detect", 5, gpio.BOTH, 5), ("add_event_detect", 6, gpio.BOTH, 5)])
+
+def test_input_move(gpio):
+	trim_encoder = make_encoder(gpio)
+	trim_encoder.rotation = 3000
+	reconfigure(trim_encoder, ip_b=12)
+	assert ("remove_event_detect", 6) in gpio.calls
+	assert ("setup", 12, gpio.IN) in gpio.calls
+	assert ("add_event_detect", 12, gpio.BOTH, 30) in gpio.calls
+	assert ("cleanup", 6) in gpio.calls
+	assert 5 in gpio.events and 23 in gpio.events and 6 not in gpio.events
+	assert trim_encoder.rotation == 3000
+
+def test_mech_switch(gpio):
+	trim_encoder = make_encoder(gpio)
+	reconfigure(trim_encoder, mech=True)
+	assert gpio.events[5][0] == gpio.FALLING
+	assert 6 not in gpio.events
+	# B is still an input, read as a level by the mechanical decoder
+	assert ("cleanup", 6) not in gpio.calls
+	assert ("remove_event_detect", 23) not in gpio.calls
+
+def test_button_led_swap(gpio):
+	trim_encoder = make_encoder(gpio)
+	trim_encoder.encoder_enabled = True
+	reconfigure(trim_encoder, ip_pb=17, op_led=23)
+	# Neither pin is released or driven low while it moves role
+	assert ("cleanup", 17) not in gpio.calls
+	assert ("cleanup", 23) not in gpio.calls
+	assert ("output", 17, False) not in gpio.calls
+	assert gpio.calls.index(("remove_event_detect", 23)) < gpio.calls.index(("setup", 23, gpio.OUT))
+	assert ("setup", 17, gpio.IN) in gpio.calls
+	assert ("output", 23, True) in gpio.calls
+	assert gpio.events[17][1] == trim_encoder.enable_encoder
+
+def test_output_move_releases_old_pin(gpio):
+	trim_encoder = make_encoder(gpio)
+	reconfigure(trim_encoder, op_en=19)
+	assert gpio.calls == [("output", 18, False), ("cleanup", 18),
+		("setup", 19, gpio.OUT), ("output", 19, False)]
+
+def test_config_settings(gpio):
+	trim_encoder = make_encoder(gpio)
+	settings = encoder.config_settings(trim_encoder, {"input": [5, 12, 23], "encoder": 5, "mech": True})
+	assert settings["ip_b"] == 12
+	assert settings["enc_bounce"] == 5
+	assert settings["mech"] == True
+	assert settings["op_led"] == 17
+
+def test_config_rejected():
+	for config in ({"input": [5, 6]}, {"input": "567"}, {"output": [17]},
+			{"input": [5, 6, 99]}, {"encoder": 500}, {"mech": "yes"},
+			{"input": [5, 5, 23]}, {"input": [5, 6, 17], "output": [17, 18]}):
+		assert encoder.check_config(config) == False, config
+	assert encoder.check_config({}) == True
+
+def test_config_settings_rejected(gpio):
+	trim_encoder = make_encoder(gpio)
+	assert encoder.config_settings(trim_encoder, {"input": "567"}) == None
+	assert encoder.config_settings(trim_encoder, {"input": [5, 6]}) == None
+	# Overlap with the running output pins
+	assert encoder.config_settings(trim_encoder, {"input": [5, 6, 17]}) == None
+	assert encoder.config_settings(trim_encoder, {"output": [23, 18]}) == None
+
+def test_reconfigure_failure_restores(gpio):
+	trim_encoder = make_encoder(gpio)
+	add_event_detect = gpio.add_event_detect
+	def failing_add(pin, edge, callback, bouncetime):
+		if pin == 12:
+			raise RuntimeError("Failed to add edge detection")
+		add_event_detect(pin, edge, callback, bouncetime)
+	gpio.add_event_detect = failing_add
+	before = trim_encoder.settings()
+	try:
+		reconfigure(trim_encoder, ip_b=12, enc_bounce=5)
+		assert False, "no error raised"
+	except RuntimeError:
+		pass
+	assert trim_encoder.settings() == before
+	assert trim_encoder.decoder[3] == 6
+	assert sorted(trim_encoder.events) == [5, 6, 23]
+	assert dict((pin, gpio.events[pin][2]) for pin in gpio.events) == {5: 30, 6: 30, 23: 300}
+	assert ("setup", 6, gpio.IN) in gpio.calls
+	# Still reconfigurable afterwards
+	gpio.add_event_detect = add_event_detect
+	reconfigure(trim_encoder, ip_b=13)
+	assert sorted(gpio.events) == [5, 13, 23]
+
+def test_watcher_survives_handler_error(tmp_path):
+	import config_watch
+	import time
+	path = tmp_path / "config.json"
+	path.write_text("{}")
+	seen = []
+	def on_change(config):
+		seen.append(config)
+		if len(seen) == 1:
+			raise RuntimeError("Failed to add edge detection")
+	watcher = config_watch.config_watch(str(path), on_change, interval=0.01)
+	watcher.start()
+	for value in (1, 20):
+		time.sleep(0.05)
+		path.write_text('{"resolution": %d}' % value)
+		time.sleep(0.05)
+	watcher.close()
+	assert seen == [{"resolution": 1}, {"resolution": 20}]
+
+class fake_i2c (object):
+	''' os.open/os.write/fcntl.ioctl on /dev/i2c-N, recorded; other files
+		go to the real os functions
+	'''
+	def __init__(self, monkeypatch, fail=False):
+		import fcntl
+		self.calls = []
+		self.fail = fail
+		self.os_open = encoder.os.open
+		self.os_write = encoder.os.write
+		self.os_close = encoder.os.close
+		monkeypatch.setattr(encoder.os, "open", self.open)
+		monkeypatch.setattr(encoder.os, "write", self.write)
+		monkeypatch.setattr(encoder.os, "close", self.close)
+		monkeypatch.setattr(fcntl, "ioctl", self.ioctl)
+
+	def open(self, path, flags, *mode):
+		if not path.startswith("/dev/i2c"):
+			return self.os_open(path, flags, *mode)
+		if self.fail:
+			raise OSError(2, "No such file or directory")
+		self.calls.append(("open", path))
+		return 99
+
+	def ioctl(self, fd, request, arg):
+		self.calls.append(("ioctl", fd, request, arg))
+
+	def write(self, fd, data):
+		if fd != 99:
+			return self.os_write(fd, data)
+		self.calls.append(("write", fd, bytes(data)))
+		return len(data)
+
+	def close(self, fd):
+		if fd != 99:
+			return self.os_close(fd)
+		self.calls.append(("close", fd))
+
+def test_early_dac_write_bytes(monkeypatch):
+	# Same bytes as MCP4725.set_voltage: WRITEDAC 0x40, value >> 4, value << 4
+	for value, data in ((0, b'\x40\x00\x00'), (2048, b'\x40\x80\x00'), (4095, b'\x40\xff\xf0'),
+			(1234, b'\x40\x4d\x20'), (-5, b'\x40\x00\x00'), (5000, b'\x40\xff\xf0')):
+		i2c = fake_i2c(monkeypatch)
+		encoder.early_dac_write(value, 0x62, 1)
+		assert i2c.calls == [("open", "/dev/i2c-1"), ("ioctl", 99, 0x0703, 0x62),
+			("write", 99, data), ("close", 99)], value
+		monkeypatch.undo()
+
+def test_process_age():
+	age = encoder.process_age()
+	assert age != None and 0 <= age < 600
+
+def test_process_age_no_proc(monkeypatch):
+	def no_proc(path):
+		raise IOError(2, "No such file or directory")
+	monkeypatch.setattr(encoder, "open", no_proc, raising=False)
+	assert encoder.process_age() == None
+
+def restore_args(journal_path, **changes):
+	args = {"no_journal": False, "journal": journal_path, "standby_fd": None, "start_time": None}
+	args.update(changes)
+	return args
+
+def test_restore_output_from_journal(tmp_path, monkeypatch):
+	import journal
+	import metrics
+	monkeypatch.setattr(metrics, "VALUES", {})
+	path = str(tmp_path / "j")
+	j = journal.journal(path)
+	j.record(3000, True)
+	j.map.close()
+	i2c = fake_i2c(monkeypatch)
+	position_journal, rotation, enabled = encoder.restore_output(restore_args(path), None, 0x62, 1)
+	position_journal.map.close()
+	assert (rotation, enabled) == (3000, True)
+	assert ("write", 99, b'\x40\xbb\x80') in i2c.calls
+	values = metrics.snapshot()
+	assert "first_output_ms" in values and "journal_restore_ms" in values
+	assert "first_output_process_ms" in values
+
+def test_restore_output_no_journal_dir(tmp_path, monkeypatch):
+	i2c = fake_i2c(monkeypatch)
+	path = str(tmp_path / "missing" / "encoder.journal")
+	position_journal, rotation, enabled = encoder.restore_output(restore_args(path), None, 0x62, 1)
+	assert (position_journal, rotation, enabled) == (None, 2048, False)
+	assert ("write", 99, b'\x40\x80\x00') in i2c.calls
+
+def test_restore_output_resume_and_bus_down(tmp_path, monkeypatch):
+	fake_i2c(monkeypatch, fail=True)
+	args = restore_args(None, no_journal=True, start_time=1.0)
+	assert encoder.restore_output(args, (10, True), 0x62, 1) == (None, 10, True)
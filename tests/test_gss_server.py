@@ -0,0 +1,116 @@
+import socket
+import time
+
+import pytest
+
+import encoder
+import gss_server
+
+def frames_from(data):
+	size = gss_server.STATE_FRAME.size
+	return [gss_server.STATE_FRAME.unpack_from(data, i) for i in range(0, len(data) - len(data) % size, size)]
+
+def recv_frames(sock, count=1, timeout=2.0):
+	''' Read whole state frames; at least count of them or until timeout
+	'''
+	sock.settimeout(timeout)
+	data = b""
+	deadline = time.time() + timeout
+	while len(data) < count * gss_server.STATE_FRAME.size and time.time() < deadline:
+		chunk = sock.recv(65536)
+		if not chunk:
+			break
+		data += chunk
+	return frames_from(data)
+
+def wait_for(sock, predicate, timeout=2.0):
+	deadline = time.time() + timeout
+	while time.time() < deadline:
+		for frame in recv_frames(sock, 1, deadline - time.time()):
+			if predicate(frame):
+				return frame
+	raise AssertionError("no matching frame")
+
+@pytest.fixture
+def server(gpio):
+	trim_encoder = encoder.encoder()
+	srv = gss_server.gss_server(trim_encoder, tcp_port=0, enable_interval=0.05)
+	srv.start()
+	yield srv
+	srv.close()
+
+def connect(srv):
+	return socket.create_connection(srv.address()[0], timeout=2.0)
+
+def test_initial_frame(server):
+	client = connect(server)
+	frame_type, flags, position, code, sequence = recv_frames(client)[0]
+	assert frame_type == gss_server.FRAME_STATE
+	assert flags == 0
+	assert (position, code) == (2048, 2048)
+
+def test_enable_and_set_point(server):
+	client = connect(server)
+	recv_frames(client)
+	client.sendall(gss_server.pack_command(gss_server.CMD_ENABLE, 1))
+	wait_for(client, lambda frame: frame[1] & gss_server.FLAG_ENABLED)
+	client.sendall(gss_server.pack_command(gss_server.CMD_SET_POINT, 5000))
+	frame = wait_for(client, lambda frame: frame[2] != 2048)
+	# Set point is clamped to the DAC range
+	assert (frame[2], frame[3]) == (4095, 4095)
+	assert server.encoder.get_state() == (4095, True)
+
+def test_set_point_ignored_while_disabled(server):
+	client = connect(server)
+	recv_frames(client)
+	client.sendall(gss_server.pack_command(gss_server.CMD_SET_POINT, 100))
+	time.sleep(0.1)
+	assert server.encoder.get_state() == (2048, False)
+
+def test_slow_client_coalesced(server):
+	client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+	client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+	client.connect(server.address()[0])
+	recv_frames(client)
+	server.encoder.set_enabled(True)
+	steps = 50000
+	for i in range(steps):
+		server.encoder.step(1)
+	time.sleep(0.2)
+	client.settimeout(0.5)
+	data = b""
+	try:
+		while True:
+			chunk = client.recv(65536)
+			if not chunk:
+				break
+			data += chunk
+	except socket.timeout:
+		pass
+	assert len(data) % gss_server.STATE_FRAME.size == 0
+	frames = frames_from(data)
+	assert len(frames) < steps
+	# Latest value always arrives; sequence only moves forward
+	assert frames[-1][2] == 2048 + steps
+	sequences = [frame[4] for frame in frames]
+	assert sequences == sorted(sequences)
+
+def test_unknown_command_closes(server):
+	client = connect(server)
+	recv_frames(client)
+	client.sendall(b"\x99\x00\x00\x00\x00\x00")
+	client.settimeout(2.0)
+	assert client.recv(4096) == b""
+
+def test_enable_commands_serialized(server, gpio):
+	client = connect(server)
+	recv_frames(client)
+	for i in range(20):
+		client.sendall(gss_server.pack_command(gss_server.CMD_ENABLE, i % 2 == 0))
+	time.sleep(1.0)
+	# Every toggle is one whole pulse on output_en; pulses never interleave
+	pulses = [call[2] for call in gpio.calls if call[:2] == ("output", server.encoder.output_en)]
+	assert pulses[0] == False
+	assert pulses[1:] == [True, False] * ((len(pulses) - 1) // 2)
+	assert len(pulses) - 1 < 20 * 2
+	assert server.encoder.get_state()[1] == False
@@ -0,0 +1,76 @@
+import os
+import time
+
+import encoder
+import journal
+
+def test_empty_journal(tmp_path):
+	j = journal.journal(str(tmp_path / "j"))
+	assert j.load() == None
+	assert os.path.getsize(str(tmp_path / "j")) == journal.SIZE
+	j.map.close()
+
+def test_round_trip(tmp_path):
+	path = str(tmp_path / "j")
+	j = journal.journal(path)
+	for rotation in range(100, 120):
+		j.record(rotation, True)
+	j.map.close()
+	assert journal.journal(path).load() == (119, True)
+
+def test_torn_write_falls_back(tmp_path):
+	path = str(tmp_path / "j")
+	j = journal.journal(path)
+	j.record(1000, True)
+	j.record(2000, False)
+	# Damage the newest slot as a power loss mid write would
+	offset = (j.sequence % journal.SLOTS) * journal.SLOT.size
+	j.map[offset + 8] ^= 0xFF
+	j.map.close()
+	assert journal.journal(path).load() == (1000, True)
+
+def test_wrong_size_file_reset(tmp_path):
+	path = str(tmp_path / "j")
+	with open(path, "wb") as f:
+		f.write(b"junk")
+	j = journal.journal(path)
+	assert j.load() == None
+	j.map.close()
+
+def test_follows_encoder(tmp_path, gpio):
+	path = str(tmp_path / "j")
+	j = journal.journal(path, interval=0.01)
+	trim_encoder = encoder.encoder()
+	j.attach(trim_encoder)
+	trim_encoder.set_enabled(True)
+	for i in range(1000):
+		trim_encoder.step(1)
+	time.sleep(0.1)
+	j.close()
+	# Rate bounded: far fewer records than changes, last state kept
+	assert j.sequence < 1000
+	assert journal.journal(path).load() == (3048, True)
+
+def test_encoder_starts_from_restored_state(gpio):
+	trim_encoder = encoder.encoder(rotation=3000, enabled=True)
+	assert trim_encoder.get_state() == (3000, True)
+	assert ("output", trim_encoder.output_led, True) in gpio.calls
+
+def test_write_error_keeps_thread(tmp_path, gpio):
+	j = journal.journal(str(tmp_path / "j"), interval=0.01)
+	trim_encoder = encoder.encoder(enabled=True)
+	failures = []
+	record = j.record
+	def failing_record(rotation, enabled):
+		if not failures:
+			failures.append(rotation)
+			raise OSError(28, "No space left on device")
+		record(rotation, enabled)
+	j.record = failing_record
+	j.attach(trim_encoder)
+	time.sleep(0.05)
+	trim_encoder.step(1)
+	time.sleep(0.05)
+	assert failures and j.thread.is_alive()
+	j.close()
+	assert journal.journal(str(tmp_path / "j")).load() == (2049, True)
@@ -0,0 +1,187 @@
+import os
+import time
+
+import pytest
+
+import metrics
+import supervisor
+
+@pytest.fixture(autouse=True)
+def clean_metrics(monkeypatch):
+	monkeypatch.setattr(metrics, "VALUES", {})
+
+def test_heartbeat_frames_rate_limited():
+	r, w = os.pipe()
+	beat = supervisor.heartbeat(w, interval=10.0)
+	beat.beat(3000, True)
+	beat.beat(3001, False)
+	data = os.read(r, 100)
+	assert data == supervisor.HEARTBEAT.pack(3000, 1)
+	os.close(r)
+	os.close(w)
+
+def test_wait_standby_resume():
+	r, w = os.pipe()
+	os.write(w, supervisor.RESUME.pack(-5, 1, 1))
+	assert supervisor.wait_standby(r) == (-5, True)
+	os.close(w)
+
+def test_wait_standby_no_position():
+	r, w = os.pipe()
+	os.write(w, supervisor.RESUME.pack(0, 0, 0))
+	assert supervisor.wait_standby(r) == (None, None)
+	os.close(w)
+
+def test_wait_standby_pipe_closed():
+	r, w = os.pipe()
+	# Part of a frame then close: standby not needed
+	os.write(w, supervisor.RESUME.pack(1, 1, 1)[:3])
+	os.close(w)
+	assert supervisor.wait_standby(r) == None
+	os.close(r)
+
+def test_read_beats_partial_frames():
+	r, w = os.pipe()
+	os.set_blocking(r, False)
+	reader = supervisor.child.__new__(supervisor.child)
+	reader.hb_fd = r
+	reader.buffer = b''
+	reader.last_beat = None
+	frames = supervisor.HEARTBEAT.pack(10, 0) + supervisor.HEARTBEAT.pack(20, 1)
+	os.write(w, frames[:7])
+	assert reader.read_beats() == (10, False)
+	assert reader.last_beat != None
+	os.write(w, frames[7:9])
+	assert reader.read_beats() == None
+	os.write(w, frames[9:])
+	assert reader.read_beats() == (20, True)
+	assert reader.buffer == b''
+	os.close(r)
+	os.close(w)
+
+class fake_proc (object):
+	def __init__(self):
+		self.returncode = None
+		self.pid = 4321
+
+	def poll(self):
+		return self.returncode
+
+class fake_child (object):
+	''' supervisor.child stand in; tests queue heartbeats and set exit codes
+	'''
+	created = []
+
+	def __init__(self, script, argv, standby):
+		self.argv = argv
+		self.standby = standby
+		self.proc = fake_proc()
+		self.hb_fd, self.hb_w = os.pipe()
+		self.beats = []
+		self.last_beat = None
+		self.started = time.time()
+		self.promoted = None
+		self.stopped = False
+		self.dies = True
+		fake_child.created.append(self)
+
+	def read_beats(self):
+		if not self.beats:
+			return None
+		self.last_beat = time.time()
+		return self.beats.pop(0)
+
+	def promote(self, rotation, enabled):
+		self.promoted = (rotation, enabled)
+		self.started = time.time()
+
+	def stop(self, sig=None, timeout=1.0):
+		if not self.stopped:
+			os.close(self.hb_fd)
+			os.close(self.hb_w)
+		self.stopped = True
+		if self.dies:
+			self.proc.returncode = -9
+		return self.dies
+
+@pytest.fixture
+def sup(monkeypatch):
+	fake_child.created = []
+	monkeypatch.setattr(supervisor, "child", fake_child)
+	s = supervisor.supervisor("encoder.py", ["-u", "/tmp/e.sock"], stall_timeout=0.2,
+		start_timeout=0.5, restart_interval=0)
+	s.active = fake_child(s.script, s.argv, False)
+	return s
+
+def test_standby_after_first_heartbeat(sup):
+	sup.poll()
+	assert sup.standby == None
+	sup.active.beats.append((100, True))
+	sup.poll()
+	assert sup.state == (100, True)
+	assert sup.standby != None and sup.standby.standby == True
+
+def test_exit_promotes_standby(sup):
+	sup.active.beats.append((100, True))
+	sup.poll()
+	old, standby = sup.active, sup.standby
+	old.proc.returncode = 1
+	sup.poll()
+	assert old.stopped
+	assert sup.active is standby
+	assert standby.promoted == (100, True)
+	# Next standby waits for the promoted child's first heartbeat
+	assert sup.standby == None
+	assert metrics.snapshot()["restarts"] == 1
+	standby.beats.append((100, True))
+	sup.poll()
+	values = metrics.snapshot()
+	assert values["restart_latency_ms"] >= 0
+	assert values["output_gap_ms"] >= values["restart_latency_ms"]
+	assert sup.standby != None
+
+def test_start_timeout_without_standby(sup):
+	sup.active.started = time.time() - 1.0
+	old = sup.active
+	sup.poll()
+	assert old.stopped
+	# No standby yet: a new one is started and promoted, no position known
+	assert sup.active is fake_child.created[-1] and sup.active is not old
+	assert sup.active.promoted == (None, None)
+
+def test_stall_restarts(sup):
+	sup.active.beats.append((7, False))
+	sup.poll()
+	old = sup.active
+	sup.poll()
+	assert sup.active is old
+	old.last_beat = time.time() - 1.0
+	sup.poll()
+	assert sup.active is not old
+	assert sup.active.promoted == (7, False)
+
+def test_stuck_child_reaped_later(sup):
+	sup.active.beats.append((7, False))
+	sup.poll()
+	stuck = sup.active
+	stuck.dies = False
+	stuck.last_beat = time.time() - 1.0
+	sup.poll()
+	assert sup.active is not stuck
+	assert sup.dying == [stuck]
+	sup.poll()
+	assert sup.dying == [stuck]
+	stuck.proc.returncode = -9
+	sup.poll()
+	assert sup.dying == []
+
+def test_first_child_gets_start_time(monkeypatch):
+	fake_child.created = []
+	monkeypatch.setattr(supervisor, "child", fake_child)
+	s = supervisor.supervisor("encoder.py", ["-u", "/tmp/e.sock"], start_time=12.5)
+	def stop():
+		raise KeyboardInterrupt
+	s.poll = stop
+	s.run()
+	assert fake_child.created[0].argv == ["-u", "/tmp/e.sock", "--start-time", "12.5"]
+	assert fake_child.created[0].stopped